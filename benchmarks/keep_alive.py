@@ -0,0 +1,91 @@
+"""
+Benchmark of request latency with and without persistent (keep-alive) connections
+
+Starts a threaded ``HostHttpServer`` in each mode and makes a series of requests, to get the
+manifest and to execute a small cell, reporting latency percentiles e.g.
+
+    python benchmarks/keep_alive.py --requests 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from six.moves import http_client  # noqa: E402
+
+from stencila.host import Host  # noqa: E402
+from stencila.host_http_server import HostHttpServer  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(keep_alive, requests):
+    """
+    Measure the latency of requests to a server
+
+    :param keep_alive: Whether the server and client keep connections alive
+    :param requests: Number of requests of each type to make
+    :returns: A dictionary of latency statistics (in milliseconds) for each type of request
+    """
+    host = Host()
+    server = HostHttpServer(host, port=2600, threaded=True, keep_alive=keep_alive).start()
+    id = host.create('PythonContext')
+    address = ('127.0.0.1', server._port)
+
+    # Authorize once and then use the session cookie
+    connection = http_client.HTTPConnection(*address)
+    connection.request('GET', '/manifest', headers={'Authorization': 'Bearer ' + host.generate_token()})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';')[0]
+
+    results = {}
+    for name, method, path, body in (
+        ('manifest', 'GET', '/manifest', None),
+        ('execute', 'PUT', '/%s!execute' % id, json.dumps({'code': '6 * 7'}))
+    ):
+        times = []
+        for _ in range(requests):
+            start = timeit.default_timer()
+            if not keep_alive:
+                connection.close()
+                connection = http_client.HTTPConnection(*address)
+            connection.request(method, path, body, {'Cookie': cookie})
+            response = connection.getresponse()
+            response.read()
+            times.append((timeit.default_timer() - start) * 1000)
+            assert response.status == 200, response.status
+        results[name] = {
+            'mean': sum(times) / len(times),
+            'p50': percentile(times, 0.5),
+            'p99': percentile(times, 0.99)
+        }
+
+    connection.close()
+    server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--requests', type=int, default=500, help='Number of requests of each type')
+    options = parser.parse_args()
+
+    print('%-12s %-10s %10s %10s %10s' % ('connection', 'request', 'mean (ms)', 'p50 (ms)', 'p99 (ms)'))
+    for keep_alive in (False, True):
+        results = measure(keep_alive, options.requests)
+        for name, stats in results.items():
+            print('%-12s %-10s %10.3f %10.3f %10.3f' % (
+                'keep-alive' if keep_alive else 'close', name, stats['mean'], stats['p50'], stats['p99']
+            ))
+
+
+if __name__ == '__main__':
+    main()
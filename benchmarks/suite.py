@@ -0,0 +1,400 @@
+"""
+Micro-benchmarks of packing values, executing cells in contexts and HTTP round trips
+
+Benchmarks use data generated from a fixed seed, at sizes which depend on the ``--scale``
+(from ``small``, which takes a few seconds, to ``large`` which includes multi-million row tables).
+Results can be written as JSON and compared against a stored baseline (the results of an earlier
+run) e.g.
+
+    python benchmarks/suite.py --scale medium --output baseline.json
+    # ... make some changes ...
+    python benchmarks/suite.py --scale medium --baseline baseline.json
+
+When comparing, a benchmark is a regression if its minimum time (the least affected by other
+activity on the machine) is more than its tolerance (a fraction, by default ``--tolerance``, but
+larger for noisier benchmarks) slower than the baseline.
+The exit status is 1 if there are any regressions.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy  # noqa: E402
+import pandas  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+from werkzeug.wrappers import Response  # noqa: E402
+
+from stencila import binary  # noqa: E402
+from stencila.host import Host  # noqa: E402
+from stencila.host_http_server import HostHttpServer  # noqa: E402
+from stencila.python_context import PythonContext  # noqa: E402
+from stencila.sqlite_context import SqliteContext  # noqa: E402
+from stencila.value import pack, unpack  # noqa: E402
+from stencila.version import __version__  # noqa: E402
+
+# Seed for generated data
+SEED = 42
+
+# Data sizes for each scale
+SCALES = {
+    'small': {
+        'rows': (100, 10000),
+        'variables': (10, 100)
+    },
+    'medium': {
+        'rows': (100, 10000, 100000),
+        'variables': (10, 100, 1000)
+    },
+    'large': {
+        'rows': (100, 10000, 1000000, 2000000),
+        'variables': (10, 100, 1000, 10000)
+    }
+}
+
+# Default tolerance for regressions
+TOLERANCE = 0.2
+
+# Registered benchmarks
+BENCHMARKS = []
+
+
+def benchmark(parameter=None, tolerance=None):
+    """
+    Register a benchmark
+
+    The decorated function does any setup and returns the function to be timed. If ``parameter``
+    is given (e.g. ``rows``) it is called with each of the values of the parameter for the scale.
+
+    :param parameter: Name of the data size parameter, if any
+    :param tolerance: Tolerance for regressions, for benchmarks that are noisier than most
+    """
+    def register(func):
+        BENCHMARKS.append((func, parameter, tolerance))
+        return func
+    return register
+
+
+def table(rows):
+    """
+    Generate a table with integer, float, boolean and string columns
+    """
+    random = numpy.random.RandomState(SEED)
+    return pandas.DataFrame({
+        'integer': random.randint(0, 1000, rows),
+        'number': random.rand(rows),
+        'boolean': random.rand(rows) > 0.5,
+        'string': random.choice(['alpha', 'beta', 'gamma', 'delta'], rows)
+    })
+
+
+def check(result):
+    """
+    Check that an executed cell has no error messages, so that errors are not benchmarked
+    """
+    assert not result['messages'], result['messages']
+    return result
+
+
+class Quiet(object):
+    """
+    Suppress output to stdout (e.g. ``SqliteContext.execute`` prints the SQL it executes)
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *args):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+@benchmark('rows')
+def pack_table(rows):
+    data = table(rows)
+    return lambda: pack(data)
+
+
+@benchmark('rows')
+def unpack_table(rows):
+    package = pack(table(rows))
+    return lambda: unpack(package)
+
+
+@benchmark('rows')
+def pack_table_json(rows):
+    package = pack(table(rows))
+    return lambda: json.dumps(package)
+
+
+@benchmark('rows')
+def pack_table_binary(rows):
+    package = pack(table(rows))
+    return lambda: binary.encode(package)
+
+
+@benchmark('rows')
+def pack_table_columnar(rows):
+    data = table(rows)
+    return lambda: binary.encode(pack(data, 'columnar'))
+
+
+@benchmark('rows')
+def unpack_table_columnar(rows):
+    encoded = binary.encode(pack(table(rows), 'columnar'))
+    return lambda: unpack(encoded)
+
+
+@benchmark('variables')
+def python_compile(variables):
+    context = PythonContext()
+    code = 'y = ' + ' + '.join('x%s' % index for index in range(variables))
+    return lambda: context.compile(code)
+
+
+@benchmark('variables')
+def python_execute(variables):
+    context = PythonContext()
+    # Variables already in the context (which are not inputs to the cell)
+    context.execute('\n'.join('z%s = %s' % (index, index) for index in range(variables)))
+    # Inputs to the cell
+    inputs = [{'name': 'x%s' % index, 'value': pack(index)} for index in range(variables)]
+    code = 'y = ' + ' + '.join('x%s' % index for index in range(variables))
+    check(context.execute({'code': code, 'inputs': inputs}))
+    return lambda: context.execute({'code': code, 'inputs': inputs})
+
+
+@benchmark('rows')
+def python_execute_table(rows):
+    # Without a limit on rows so that the whole table is packed, rather than a pointer to it
+    context = PythonContext(max_rows=None)
+    code = 'import numpy, pandas\npandas.DataFrame({"x": numpy.arange(%s)})' % rows
+    check(context.execute(code))
+    return lambda: context.execute(code)
+
+
+@benchmark('rows')
+def python_execute_table_pointer(rows):
+    context = PythonContext()
+    code = 'import numpy, pandas\npandas.DataFrame({"x": numpy.arange(%s)})' % rows
+    check(context.execute(code))
+    return lambda: context.execute(code)
+
+
+@benchmark('rows')
+def python_fetch(rows):
+    context = PythonContext()
+    check(context.execute('import numpy, pandas\ndata = pandas.DataFrame({"x": numpy.arange(%s)})' % rows))
+    # The last page of rows, sorted
+    options = {'sort': '-x', 'offset': max(rows - 100, 0), 'limit': 100}
+    return lambda: context.fetch('data', options)
+
+
+@benchmark('rows')
+def sqlite_execute(rows):
+    context = SqliteContext()
+    data = table(rows)
+    context._connection.execute('CREATE TABLE data (integer INTEGER, number REAL, boolean INTEGER, string TEXT)')
+    context._connection.executemany('INSERT INTO data VALUES (?, ?, ?, ?)', zip(
+        data['integer'].tolist(), data['number'].tolist(), data['boolean'].tolist(), data['string'].tolist()
+    ))
+    cell = {
+        'type': 'cell',
+        'code': 'summary = SELECT string, count(*), avg(number) FROM data WHERE boolean GROUP BY string'
+    }
+
+    def execute():
+        with Quiet():
+            return context.execute(dict(cell))
+    check(execute())
+    return execute
+
+
+def http_client():
+    """
+    Create a werkzeug test client for a ``HostHttpServer`` which has been authorized
+    (so that the session cookie is used for subsequent requests)
+
+    :returns: A tuple of the host, and the client
+    """
+    host = Host()
+    client = Client(HostHttpServer(host), Response)
+    response = client.get('/manifest', headers={'Authorization': 'Bearer ' + host.generate_token()})
+    assert response.status_code == 200, response.status_code
+    return host, client
+
+
+def http_request(client, method, path, data=None, headers=None):
+    response = client.open(path, method=method, data=data, headers=headers)
+    assert response.status_code == 200, response.status_code
+    return response.data
+
+
+@benchmark(tolerance=0.5)
+def http_manifest():
+    host, client = http_client()
+    return lambda: http_request(client, 'GET', '/manifest')
+
+
+@benchmark(tolerance=0.5)
+def http_execute():
+    host, client = http_client()
+    id = host.create('PythonContext')
+    body = json.dumps({'code': '6 * 7'})
+    return lambda: http_request(client, 'PUT', '/%s!execute' % id, body)
+
+
+@benchmark('rows', tolerance=0.5)
+def http_execute_table(rows):
+    host, client = http_client()
+    id = host.create('PythonContext')
+    body = json.dumps({
+        'code': 'import numpy, pandas\npandas.DataFrame({"x": numpy.arange(%s) / 7})' % rows,
+        'options': {'max_rows': None}
+    })
+    return lambda: http_request(client, 'PUT', '/%s!execute' % id, body)
+
+
+@benchmark('rows', tolerance=0.5)
+def http_execute_table_binary(rows):
+    host, client = http_client()
+    id = host.create('PythonContext')
+    body = json.dumps({
+        'code': 'import numpy, pandas\npandas.DataFrame({"x": numpy.arange(%s) / 7})' % rows,
+        'options': {'max_rows': None}
+    })
+    headers = {'Accept': binary.MEDIA_TYPE}
+    return lambda: http_request(client, 'PUT', '/%s!execute' % id, body, headers)
+
+
+def measure(func, repeat, min_time):
+    """
+    Measure the time taken to call a function
+
+    The function is called enough times, in each of ``repeat`` rounds, for each
+    round to take at least ``min_time`` seconds.
+
+    :returns: A dictionary of statistics of the time (seconds) per call
+    """
+    number = 1
+    while True:
+        elapsed = timeit.timeit(func, number=number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    times = sorted(
+        elapsed / number for elapsed in timeit.repeat(func, number=number, repeat=repeat)
+    )
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'mean': sum(times) / len(times),
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def run(scale, patterns=None, repeat=5, min_time=0.2):
+    """
+    Run benchmarks
+
+    :param scale: Name of the scale for data sizes
+    :param patterns: Glob patterns for the names of the benchmarks to run
+    :returns: A dictionary of results for each benchmark
+    """
+    results = {}
+    for func, parameter, tolerance in BENCHMARKS:
+        for value in SCALES[scale][parameter] if parameter else (None,):
+            name = func.__name__
+            if parameter:
+                name += '[%s=%s]' % (parameter, value)
+            if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                continue
+            timed = func(value) if parameter else func()
+            result = measure(timed, repeat, min_time)
+            if tolerance:
+                result['tolerance'] = tolerance
+            results[name] = result
+            print('%-45s %12.6f %12.6f %10d' % (name, result['min'], result['median'], result['number']))
+            sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare results against a baseline
+
+    :param tolerance: Default tolerance, as a fraction of the baseline minimum time
+    :returns: A list of the names of benchmarks which have regressed
+    """
+    regressions = []
+    print('\n%-45s %12s %12s %10s' % ('benchmark', 'baseline (s)', 'min (s)', 'change'))
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base:
+            print('%-45s %12s %12.6f %10s' % (name, '-', result['min'], 'new'))
+            continue
+        change = result['min'] / base['min'] - 1
+        limit = max(tolerance, result.get('tolerance', 0))
+        status = ''
+        if change > limit:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change < -limit:
+            status = 'improvement'
+        print('%-45s %12.6f %12.6f %+9.1f%% %s' % (name, base['min'], result['min'], change * 100, status))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('patterns', nargs='*', help='Glob patterns for the names of benchmarks to run e.g. "pack_*"')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help='Scale of data sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of rounds of timing')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum time (seconds) for each round')
+    parser.add_argument('--output', help='File to write results to (JSON)')
+    parser.add_argument('--baseline', help='File of results (JSON) to compare against')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='Tolerance for regressions (fraction)')
+    options = parser.parse_args()
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as file:
+            baseline = json.load(file)
+        if baseline['meta']['scale'] != options.scale:
+            parser.error('Baseline is for scale "%s"' % baseline['meta']['scale'])
+
+    print('%-45s %12s %12s %10s' % ('benchmark', 'min (s)', 'median (s)', 'calls'))
+    results = run(options.scale, options.patterns, options.repeat, options.min_time)
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump({
+                'meta': {
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'scale': options.scale,
+                    'seed': SEED,
+                    'stencila': __version__,
+                    'python': platform.python_version(),
+                    'platform': platform.platform()
+                },
+                'results': results
+            }, file, indent=2, sort_keys=True)
+
+    if baseline:
+        regressions = compare(results, baseline['results'], options.tolerance)
+        if regressions:
+            print('\n%s regression(s)' % len(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
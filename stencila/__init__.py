@@ -5,6 +5,7 @@ from .sqlite_context import SqliteContext
 from .host import Host, host
 from .host_http_server import HostHttpServer
 from .value import type, pack, unpack
+from .loadtest import loadtest
 
 
 def register(*args, **kwargs):  # pragma: no cover
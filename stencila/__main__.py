@@ -8,14 +8,28 @@ standard input. e.g.
 
   python -m stencila register
   python -m stencila spawn '{"port":2300}'
+  python -m stencila spawn '{"asynchronous":true}'
+  python -m stencila spawn '{"warm":4}'
+  python -m stencila loadtest '{"sessions":8,"duration":30}'
+  python -m stencila loadtest '{"sessions":8,"duration":30}' --json
   echo '{"port":2300}' | python -m stencila spawn
+
+Functions which print a summary of their result (e.g. ``loadtest``) output
+either that summary or, with the ``--json`` flag, the result as JSON.
 """
 import json
 import stencila
 import sys
 
+# Functions which print a summary of their result unless `quiet`
+SUMMARIZING = ('loadtest',)
+
+# Whether to output the result of a summarizing function as JSON instead
+as_json = '--json' in sys.argv
+argv = [arg for arg in sys.argv if arg != '--json']
+
 # Function to execute
-name = sys.argv[1] if len(sys.argv) > 1 else 'run'
+name = argv[1] if len(argv) > 1 else 'run'
 func = vars(stencila).get(name)
 if not func:
     print('Not a valid function: ' + name)
@@ -23,7 +37,7 @@ if not func:
 
 
 # Function options as JSON object from second argument or stdin
-inp = sys.argv[2] if len(sys.argv) > 2 else ''
+inp = argv[2] if len(argv) > 2 else ''
 options = {}
 if len(inp):
     try:
@@ -33,7 +47,9 @@ if len(inp):
         sys.exit(1)
 
 # Execute the function and output any result as JSON
+if name in SUMMARIZING and as_json:
+    options['quiet'] = True
 result = func(**options)
-if result:
+if result and (name not in SUMMARIZING or as_json):
     out = json.dumps(result)
     print(out)
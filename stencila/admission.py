@@ -0,0 +1,85 @@
+"""
+Admission control for a `Host`: limits on the number of concurrent calls
+"""
+
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """
+    Raised when a call can not be started, either because too many calls
+    are waiting or because it's deadline would pass before it could be started
+
+    :param retry_after: Number of seconds after which the caller could retry
+    """
+
+    def __init__(self, message, retry_after=1):
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class Limiter(object):
+    """
+    Limits the number of concurrent calls to ``limit``
+
+    Calls beyond the limit wait (in a queue of at most ``queue`` calls, if
+    specified) until an earlier call finishes or their deadline passes.
+    Waiting calls are released in no particular order.
+    """
+
+    def __init__(self, limit, queue=None):
+        self._limit = limit
+        self._queue = queue
+        self._active = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    @property
+    def active(self):
+        """
+        Get the number of calls that are active
+        """
+        return self._active
+
+    @property
+    def waiting(self):
+        """
+        Get the number of calls that are waiting
+        """
+        return self._waiting
+
+    def acquire(self, deadline=None):
+        """
+        Wait for a call to be able to start
+
+        :param deadline: Time (seconds since the epoch) by which the call must be started
+        :raises Overloaded: If the queue is full or the deadline passes
+        """
+        with self._condition:
+            if self._active < self._limit:
+                self._active += 1
+                return
+            if self._queue is not None and self._waiting >= self._queue:
+                raise Overloaded('Too many calls waiting: %s' % self._waiting)
+            self._waiting += 1
+            try:
+                while self._active >= self._limit:
+                    if deadline is None:
+                        self._condition.wait()
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise Overloaded('Deadline passed before call could be started')
+                        self._condition.wait(remaining)
+                self._active += 1
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        """
+        Record that a call has finished
+        """
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
@@ -0,0 +1,331 @@
+"""
+A compact binary encoding of values, an alternative to JSON
+
+Uses the MessagePack format (https://msgpack.org) with an extension type for
+typed arrays: sequences of numbers (or booleans) which are encoded as a raw,
+little-endian, buffer rather than item by item. Numpy arrays, ``array.array``\\s,
+and lists of only floats, only integers or only booleans (e.g. the columns of a
+packed table) are encoded as typed arrays, which is much faster, and more compact,
+than encoding them as JSON. Typed arrays are decoded as lists so that a value
+decoded from this format is the same as one decoded from JSON.
+"""
+
+import array
+import struct
+import sys
+
+import six
+
+# Media type for the format
+MEDIA_TYPE = 'application/msgpack'
+
+# Media types which are accepted for the format
+MEDIA_TYPES = (MEDIA_TYPE, 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Extension type code for typed arrays
+TYPED_ARRAY = 1
+
+# Minimum length of a list for it to be checked for whether
+# it can be encoded as a typed array
+TYPED_ARRAY_MIN = 8
+
+# Typed array item codes: the item's `struct` format character is used as
+# it's code, and the corresponding `array` type code (with the same size)
+ITEM_TYPES = {
+    'b': 'b', 'B': 'B', 'h': 'h', 'H': 'H',
+    'i': 'i' if array.array('i').itemsize == 4 else 'l',
+    'I': 'I' if array.array('I').itemsize == 4 else 'L',
+    'q': 'q', 'Q': 'Q', 'f': 'f', 'd': 'd'
+}
+
+# Typed array item codes for numpy data types, by kind and item size
+NUMPY_CODES = {
+    ('i', 1): 'b', ('u', 1): 'B', ('i', 2): 'h', ('u', 2): 'H',
+    ('i', 4): 'i', ('u', 4): 'I', ('i', 8): 'q', ('u', 8): 'Q',
+    ('f', 4): 'f', ('f', 8): 'd', ('b', 1): '?'
+}
+
+BIG_ENDIAN = sys.byteorder == 'big'
+
+
+def encode(value):
+    """
+    Encode a value
+
+    :param value: A value (e.g. a value package, or a cell, containing them)
+    :returns: The encoded bytes
+    """
+    parts = []
+    _encode(value, parts.append)
+    return b''.join(parts)
+
+
+def _encode(value, write):
+    cls = value.__class__
+    if value is None:
+        write(b'\xc0')
+    elif cls is bool:
+        write(b'\xc3' if value else b'\xc2')
+    elif cls in six.integer_types:
+        _encode_int(value, write)
+    elif cls is float:
+        write(struct.pack('>Bd', 0xcb, value))
+    elif cls is six.text_type:
+        data = value.encode('utf-8')
+        _encode_header(write, len(data), 0xa0, 32, 0xd9, 0xda, 0xdb)
+        write(data)
+    elif cls is six.binary_type or cls is bytearray:
+        _encode_header(write, len(value), None, 0, 0xc4, 0xc5, 0xc6)
+        write(bytes(value))
+    elif isinstance(value, dict):
+        _encode_header(write, len(value), 0x80, 16, None, 0xde, 0xdf)
+        for key, item in value.items():
+            _encode(key, write)
+            _encode(item, write)
+    elif isinstance(value, (list, tuple)):
+        if len(value) >= TYPED_ARRAY_MIN and _encode_list(value, write):
+            return
+        _encode_header(write, len(value), 0x90, 16, None, 0xdc, 0xdd)
+        for item in value:
+            _encode(item, write)
+    elif isinstance(value, array.array):
+        if value.typecode in ('f', 'd'):
+            code = value.typecode
+        else:
+            code = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}[value.itemsize]
+            if value.typecode.isupper():
+                code = code.upper()
+        _encode_typed_array(write, code, value)
+    elif hasattr(value, 'dtype') and hasattr(value, 'tobytes'):
+        # A numpy array or scalar
+        code = NUMPY_CODES.get((value.dtype.kind, value.dtype.itemsize))
+        if code and getattr(value, 'ndim', 0) == 1:
+            if value.dtype.byteorder == '>' or (value.dtype.byteorder == '=' and BIG_ENDIAN):
+                value = value.byteswap()
+            _encode_ext(write, TYPED_ARRAY, code.encode() + value.tobytes())
+        else:
+            _encode(value.tolist(), write)
+    elif hasattr(value, 'tolist'):
+        _encode(value.tolist(), write)
+    elif hasattr(value, '__iter__'):
+        _encode(list(value), write)
+    else:
+        raise TypeError('Unable to encode value of type: %s' % cls.__name__)
+
+
+def _encode_int(value, write):
+    if not -9223372036854775808 <= value < 18446744073709551616:
+        raise ValueError('Integer is too large to encode: %s' % value)
+    if 0 <= value < 128:
+        write(struct.pack('B', value))
+    elif -32 <= value < 0:
+        write(struct.pack('b', value))
+    elif value >= 0:
+        if value < 256:
+            write(struct.pack('>BB', 0xcc, value))
+        elif value < 65536:
+            write(struct.pack('>BH', 0xcd, value))
+        elif value < 4294967296:
+            write(struct.pack('>BI', 0xce, value))
+        else:
+            write(struct.pack('>BQ', 0xcf, value))
+    else:
+        if value >= -128:
+            write(struct.pack('>Bb', 0xd0, value))
+        elif value >= -32768:
+            write(struct.pack('>Bh', 0xd1, value))
+        elif value >= -2147483648:
+            write(struct.pack('>Bi', 0xd2, value))
+        else:
+            write(struct.pack('>Bq', 0xd3, value))
+
+
+def _encode_header(write, length, fix, fix_max, code8, code16, code32):
+    if length < fix_max:
+        write(struct.pack('B', fix | length))
+    elif code8 and length < 256:
+        write(struct.pack('>BB', code8, length))
+    elif length < 65536:
+        write(struct.pack('>BH', code16, length))
+    else:
+        write(struct.pack('>BI', code32, length))
+
+
+def _encode_ext(write, type, data):
+    length = len(data)
+    fixed = {1: 0xd4, 2: 0xd5, 4: 0xd6, 8: 0xd7, 16: 0xd8}.get(length)
+    if fixed:
+        write(struct.pack('>Bb', fixed, type))
+    elif length < 256:
+        write(struct.pack('>BBb', 0xc7, length, type))
+    elif length < 65536:
+        write(struct.pack('>BHb', 0xc8, length, type))
+    else:
+        write(struct.pack('>BIb', 0xc9, length, type))
+    write(data)
+
+
+def _encode_typed_array(write, code, values):
+    if BIG_ENDIAN and values.itemsize > 1:
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    _encode_ext(write, TYPED_ARRAY, code.encode() + values.tobytes())
+
+
+def _encode_list(values, write):
+    """
+    Encode a list as a typed array if all it's items are floats, integers, or
+    booleans
+
+    :returns: Whether or not the list was encoded
+    """
+    cls = values[0].__class__
+    if cls not in (float, int, bool) or any(value.__class__ is not cls for value in values):
+        return False
+    if cls is float:
+        _encode_typed_array(write, 'd', array.array('d', values))
+    elif cls is bool:
+        _encode_ext(write, TYPED_ARRAY, b'?' + bytes(bytearray(values)))
+    else:
+        try:
+            _encode_typed_array(write, 'q', array.array('q', values))
+        except OverflowError:
+            return False
+    return True
+
+
+def decode(data):
+    """
+    Decode a value
+
+    :param data: The encoded bytes
+    :raises ValueError: If the data is not a valid encoding of a value
+    :returns: The value
+    """
+    if six.PY2:
+        data = bytearray(data)
+    value, offset = _decode(data, 0)
+    if offset != len(data):
+        raise ValueError('Extra data after encoded value')
+    return value
+
+
+def _check(data, offset, size):
+    """
+    Check that there are ``size`` bytes of data from ``offset``
+    """
+    if offset + size > len(data):
+        raise ValueError('Encoded value is truncated')
+
+
+def _decode(data, offset):
+    _check(data, offset, 1)
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    elif code >= 0xe0:
+        return code - 0x100, offset
+    elif code < 0x90:
+        return _decode_map(data, offset, code & 0x0f)
+    elif code < 0xa0:
+        return _decode_array(data, offset, code & 0x0f)
+    elif code < 0xc0:
+        return _decode_str(data, offset, code & 0x1f)
+    elif code == 0xc0:
+        return None, offset
+    elif code == 0xc2:
+        return False, offset
+    elif code == 0xc3:
+        return True, offset
+    elif code in FIXED:
+        format, size = FIXED[code]
+        _check(data, offset, size)
+        return struct.unpack_from(format, data, offset)[0], offset + size
+    elif code in LENGTHS:
+        kind, format, size = LENGTHS[code]
+        _check(data, offset, size)
+        length = struct.unpack_from(format, data, offset)[0]
+        offset += size
+        if kind == 'str':
+            return _decode_str(data, offset, length)
+        elif kind == 'bin':
+            _check(data, offset, length)
+            return bytes(data[offset:offset + length]), offset + length
+        elif kind == 'array':
+            return _decode_array(data, offset, length)
+        elif kind == 'map':
+            return _decode_map(data, offset, length)
+        else:
+            return _decode_ext(data, offset, length)
+    elif 0xd4 <= code <= 0xd8:
+        return _decode_ext(data, offset, 1 << (code - 0xd4))
+    else:
+        raise ValueError('Invalid type code: 0x%x' % code)
+
+
+# Codes for fixed size values, with their `struct` format and size
+FIXED = {
+    0xca: ('>f', 4), 0xcb: ('>d', 8),
+    0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4), 0xcf: ('>Q', 8),
+    0xd0: ('>b', 1), 0xd1: ('>h', 2), 0xd2: ('>i', 4), 0xd3: ('>q', 8)
+}
+
+# Codes for values prefixed by a length, with the `struct` format and size of the length
+LENGTHS = {
+    0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2), 0xdb: ('str', '>I', 4),
+    0xc4: ('bin', '>B', 1), 0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+    0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+    0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4),
+    0xc7: ('ext', '>B', 1), 0xc8: ('ext', '>H', 2), 0xc9: ('ext', '>I', 4)
+}
+
+
+def _decode_str(data, offset, length):
+    _check(data, offset, length)
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def _decode_array(data, offset, length):
+    values = []
+    for _ in range(length):
+        value, offset = _decode(data, offset)
+        values.append(value)
+    return values, offset
+
+
+def _decode_map(data, offset, length):
+    values = {}
+    for _ in range(length):
+        key, offset = _decode(data, offset)
+        value, offset = _decode(data, offset)
+        try:
+            values[key] = value
+        except TypeError:
+            raise ValueError('Invalid map key: %s' % key)
+    return values, offset
+
+
+def _decode_ext(data, offset, length):
+    _check(data, offset, 1 + length)
+    type = struct.unpack_from('b', data, offset)[0]
+    start = offset + 1
+    end = offset + 1 + length
+    if type != TYPED_ARRAY:
+        raise ValueError('Unknown extension type: %s' % type)
+    if length < 1:
+        raise ValueError('Typed array has no item type')
+    code = chr(data[start])
+    payload = bytes(data[start + 1:end])
+    if code == '?':
+        return [byte != 0 for byte in bytearray(payload)], end
+    if code not in ITEM_TYPES:
+        raise ValueError('Unknown typed array item type: %s' % code)
+    values = array.array(ITEM_TYPES[code])
+    if six.PY2:
+        values.fromstring(payload)
+    else:
+        values.frombytes(payload)
+    if BIG_ENDIAN:
+        values.byteswap()
+    return values.tolist(), end
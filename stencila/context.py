@@ -29,3 +29,11 @@ class Context(object):
         cell['messages'] = cell.get('messages', [])
 
         return cell
+
+    def memory(self, *args):
+        """
+        Estimate the memory used by this context
+
+        :returns: A number of bytes
+        """
+        return 0
@@ -4,20 +4,28 @@ import atexit
 import binascii
 import collections
 import datetime
+import functools
 import json
 import jwt
 import os
 import platform
+import re
+import shutil
 import signal
 import stat
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+import timeit
 import uuid
 
 from .version import __version__
+from .admission import Limiter, Overloaded
 from .host_http_server import HostHttpServer
+from .host_metrics import HostMetrics
+from .worker import ThreadWorker, ProcessPool, ProcessInstance, HostSnapshot
 
 from .python_context import PythonContext
 from .sqlite_context import SqliteContext
@@ -48,6 +56,26 @@ class Host(object):
     in memory in each process (although, for purposes of testing, this is not enforced)
     """
 
+    # Maximum number of verified request tokens to cache (and number of used token
+    # IDs above which those of expired tokens are forgotten)
+    TOKEN_CACHE_SIZE = 1000
+
+    # Pattern for the issuer of request tokens (the id of the host that generated it)
+    ISSUER_PATTERN = r'^[a-z]+-host-\S+$'
+
+    # Maximum number of bytes in the path of a unix domain socket (the smallest limit
+    # of supported platforms; 104 bytes on macOS, including a terminating null)
+    SOCKET_PATH_MAX = 103
+
+    # Number of seconds that a session token is valid for
+    SESSION_LIFETIME = 24 * 60 * 60
+
+    # Number of seconds between checks for instances to evict
+    REAP_INTERVAL = 10
+
+    # Maximum number of evicted instances to remember
+    EVICTED_SIZE = 1000
+
     def __init__(self):
         self._id = 'py-host-%s' % uuid.uuid4()
         if os.environ.get('STENCILA_AUTH') == 'false':
@@ -59,6 +87,33 @@ class Host(object):
         self._heartbeat = None
         self._instances = {}
         self._counts = {}
+        self._workers = {}
+        self._threaded = False
+        self._pool = ProcessPool()
+        self._processes = False
+        self._warm_type = None
+        self._socket_dir = None
+        self._accessed = {}
+        self._active = {}
+        self._memory = {}
+        self._ttls = {}
+        self._evicted = collections.OrderedDict()
+        self._idle_timeout = None
+        self._memory_budget = None
+        self._reaper = None
+        self._types = {}
+        self._metrics = HostMetrics(self)
+        self._limiter = None
+        self._limiters = {}
+        self._instance_concurrency = None
+        self._queue_size = None
+        # Lock used to protect the registry of instances when
+        # requests are being served from multiple threads
+        self._lock = threading.RLock()
+        self._tokens = collections.OrderedDict()
+        self._jtis = {}
+        self._single_use_tokens = False
+        self._sessions = {}
 
     @property
     def id(self):
@@ -69,6 +124,15 @@ class Host(object):
         """
         return self._id
 
+    @property
+    def metrics(self):
+        """
+        Get the metrics for this Host
+
+        :returns: A ``HostMetrics`` instance
+        """
+        return self._metrics
+
     @property
     def key(self):
         """
@@ -143,7 +207,8 @@ class Host(object):
             manifest.update([
                 ('process', {'pid': os.getpid()}),
                 ('servers', self.servers),
-                ('instances', list(self._instances.keys()))
+                ('instances', list(self._instances.keys())),
+                ('evicted', dict(self._evicted))
             ])
 
         return manifest
@@ -170,24 +235,64 @@ class Host(object):
         """
         Create a new instance of a type
 
+        If ``args`` includes ``process: true`` (or if the host was started with
+        ``processes=True`` and it does not include ``process: false``) the instance
+        is created in it's own worker process (see ``ProcessWorker``). If the host's pool of
+        worker processes is full, it is created in the host's process instead.
+
+        If ``args`` includes ``idle_timeout``, the instance will be evicted after
+        not being used for that number of seconds (overriding the host's ``idle_timeout``).
+
         :param type: Type of instance
         :param args: Arguments to be passed to type constructor
         :returns: Name of newly created instance
         """
         Class = TYPES.get(type)
         if Class:
-            try:
-                self._counts[type] += 1
-            except KeyError:
-                self._counts[type] = 1
-            number = self._counts[type]
+            with self._lock:
+                try:
+                    self._counts[type] += 1
+                except KeyError:
+                    self._counts[type] = 1
+                number = self._counts[type]
             name = '%s%s%d' % (type[:1].lower(), type[1:], number)
 
-            args['host'] = self
+            args = dict(args)
+            process = args.pop('process', self._processes or type == self._warm_type)
+            idle_timeout = args.pop('idle_timeout', None)
             args['name'] = name
-            instance = Class(**args)
-
-            self._instances[name] = instance
+            instance = None
+            worker = None
+            if process:
+                # Construct the instance in a worker process, unless the pool is full.
+                # Methods are called via a proxy so no thread is needed.
+                process_worker = self._pool.acquire(type, dict(args, host=HostSnapshot(self)))
+                if process_worker:
+                    instance = ProcessInstance(process_worker)
+            if instance is None:
+                args['host'] = self
+                if self._threaded:
+                    # Construct the instance on it's own thread so that
+                    # all of it's methods are run on that thread
+                    worker = ThreadWorker(name)
+                    try:
+                        instance = worker.run(Class, **args)
+                    except Exception:
+                        worker.stop()
+                        raise
+                else:
+                    instance = Class(**args)
+
+            with self._lock:
+                self._instances[name] = instance
+                self._types[name] = type
+                self._accessed[name] = time.time()
+                if worker:
+                    self._workers[name] = worker
+                if self._instance_concurrency:
+                    self._limiters[name] = Limiter(self._instance_concurrency, self._queue_size)
+                if idle_timeout:
+                    self._ttls[name] = idle_timeout
             return name
         else:
             raise Exception('Unknown type: %s' % type)
@@ -201,17 +306,31 @@ class Host(object):
         """
         instance = self._instances.get(name)
         if instance:
+            self._accessed[name] = time.time()
             return instance
         else:
-            raise Exception('Unknown instance: %s' % name)
+            raise self._unknown(name)
 
-    def call(self, name, method, arg=None):
+    def call(self, name, method, arg=None, profiler=None, deadline=None, emit=None, admitted=None):
         """
         Call a method of an instance
 
+        If the host was started with ``concurrency`` or ``instance_concurrency`` limits,
+        the call waits until it can be admitted under those limits.
+
         :param name: Name of instance
         :param method: Name of instance method
         :param kwargs: A dictionary of method arguments
+        :param profiler: A ``cProfile.Profile`` to profile the method call with.
+                         The call is profiled on the thread that it is run on. For instances
+                         in worker processes only the time waiting for the process is profiled.
+        :param deadline: Time (seconds since the epoch) by which the call must be started.
+        :param emit: A function to call with progress events, for methods that
+                     emit them (e.g. ``PythonContext.execute``)
+        :param admitted: A function to call once the call has been admitted, just before
+                         the method is run
+        :raises Overloaded: If the call can not be started by the deadline, or too many
+                            calls are already waiting.
         :returns: Result of method call
         """
         instance = self._instances.get(name)
@@ -220,10 +339,109 @@ class Host(object):
                 func = getattr(instance, method)
             except AttributeError:
                 raise Exception('Unknown method: %s' % method)
-            else:
+            if getattr(func, 'concurrent', False):
+                # Methods which need to run while other methods of the instance
+                # are running (e.g. `cancel`) bypass the instance's worker and limits
                 return func(arg)
+            else:
+                # Record that the instance is being used so that it
+                # is not evicted during the call
+                with self._lock:
+                    self._active[name] = self._active.get(name, 0) + 1
+                # The instance's limiter is acquired first so that calls queued for a busy
+                # instance do not hold one of the host's slots while they wait
+                limiters = [limiter for limiter in (self._limiters.get(name), self._limiter) if limiter]
+                acquired = []
+                try:
+                    for limiter in limiters:
+                        limiter.acquire(deadline)
+                        acquired.append(limiter)
+                    if emit and getattr(func, 'streams', False):
+                        func = functools.partial(func, emit=emit)
+                    if admitted:
+                        func = self._preceded(func, admitted)
+                    if deadline:
+                        func = self._deadlined(func, deadline)
+                    start = timeit.default_timer()
+                    if profiler:
+                        result = self._run(name, profiler.runcall, func, arg)
+                    else:
+                        result = self._run(name, func, arg)
+                    # Only recorded for successful calls so that the method names labelling the
+                    # metrics are those of actual methods (e.g. instances in worker processes
+                    # accept any method name until the call fails)
+                    self._metrics.call(self._types.get(name), method, timeit.default_timer() - start)
+                    return result
+                finally:
+                    for limiter in acquired:
+                        limiter.release()
+                    with self._lock:
+                        # The instance may have been deleted during the call
+                        if name in self._instances:
+                            self._active[name] -= 1
+                            self._accessed[name] = time.time()
         else:
-            raise Exception('Unknown instance: %s' % name)
+            raise self._unknown(name)
+
+    @staticmethod
+    def _deadlined(func, deadline):
+        """
+        Wrap a function so that it is not run if it's deadline has passed
+        (e.g. while it was queued for an instance's worker thread)
+        """
+        def deadlined(*args):
+            if time.time() > deadline:
+                raise Overloaded('Deadline passed before call could be started')
+            return func(*args)
+        return deadlined
+
+    @staticmethod
+    def _preceded(func, before):
+        """
+        Wrap a function so that another function is called just before it is run
+        """
+        def preceded(*args):
+            before()
+            return func(*args)
+        return preceded
+
+    def _run(self, name, func, *args):
+        """
+        Run an instance method, on the instance's thread if it has one
+        """
+        worker = self._workers.get(name)
+        if worker:
+            return worker.run(func, *args)
+        return func(*args)
+
+    def instance_type(self, name):
+        """
+        Get the type of an instance
+
+        :param name: Name of instance
+        :returns: Type of instance (or ``None`` if there is no such instance)
+        """
+        return self._types.get(name)
+
+    def instance_counts(self):
+        """
+        Get the number of instances of each type
+
+        :returns: A dictionary of counts keyed by tuples of type
+        """
+        counts = {}
+        for type in list(self._types.values()):
+            counts[(type,)] = counts.get((type,), 0) + 1
+        return counts
+
+    def _unknown(self, name):
+        """
+        Create an error for an instance that is not in the registry
+        """
+        reason = self._evicted.get(name)
+        if reason:
+            return Exception('Instance was evicted: %s (%s)' % (name, reason))
+        return Exception('Unknown instance: %s' % name)
 
     def delete(self, name):
         """
@@ -231,34 +449,223 @@ class Host(object):
 
         :param name: Name of instance
         """
-        if name in self._instances:
-            del self._instances[name]
-        else:
-            raise Exception('Unknown instance: %s' % name)
+        with self._lock:
+            if name in self._instances:
+                instance = self._instances.pop(name)
+                worker = self._workers.pop(name, None)
+                for registry in (self._types, self._accessed, self._active, self._memory, self._ttls, self._limiters):
+                    registry.pop(name, None)
+            else:
+                raise self._unknown(name)
+        if worker:
+            worker.stop()
+        if isinstance(instance, ProcessInstance):
+            self._pool.release(instance._worker)
 
-    def start(self, address='127.0.0.1', port=2000, quiet=False):
+    def evict(self, name, reason):
         """
-        Start serving this host
+        Evict an instance
 
-        Currently, HTTP is the only server available
-        for hosts. We plan to implement a `HostWebsocketServer` soon.
+        Deletes the instance and records the reason it was evicted
+        so that subsequent requests for it get a clear error.
 
+        :param name: Name of instance
+        :param reason: Reason for eviction
+        """
+        self.delete(name)
+        with self._lock:
+            self._evicted[name] = reason
+            if len(self._evicted) > self.EVICTED_SIZE:
+                self._evicted.popitem(last=False)
+
+    def reap(self):
+        """
+        Evict instances that have been idle for too long or, if the host's
+        memory budget is exceeded, those that have been least recently used.
+
+        Instances that are currently being used are never evicted. This method is called
+        periodically (every ``REAP_INTERVAL`` seconds) while the host is serving.
+
+        :returns: A list of the names of evicted instances
+        """
+        now = time.time()
+        with self._lock:
+            candidates = sorted(
+                (self._accessed.get(name, 0), name) for name in self._instances
+                if not self._active.get(name)
+            )
+
+        evicted = []
+        idle = []
+        for accessed, name in candidates:
+            idle_timeout = self._ttls.get(name, self._idle_timeout)
+            if idle_timeout and now - accessed > idle_timeout:
+                self.evict(name, 'idle for more than %s seconds' % idle_timeout)
+                evicted.append(name)
+            else:
+                idle.append(name)
+
+        if self._memory_budget:
+            # Measure the memory used by idle instances and use the last
+            # measurement for those that are currently being used
+            for name in idle:
+                instance = self._instances.get(name)
+                if instance is None:
+                    continue
+                try:
+                    self._memory[name] = self._run(name, instance.memory, None)
+                except Exception:
+                    self._memory[name] = 0
+            total = sum(self._memory.values())
+
+            for name in idle:
+                if total <= self._memory_budget:
+                    break
+                if name in self._instances and not self._active.get(name):
+                    total -= self._memory.get(name, 0)
+                    self.evict(name, 'memory budget of %s bytes exceeded' % self._memory_budget)
+                    evicted.append(name)
+
+        return evicted
+
+    def batch(self, operations, stop=False):
+        """
+        Run a batch of operations
+
+        Allows several ``create``, ``get``, ``call`` and ``delete`` operations to be
+        requested at once. Each operation is a dictionary with a ``verb``
+        (one of those method names), an ``id`` (the type for ``create``,
+        otherwise the instance name), and optionally, a ``method`` (for ``call``)
+        and an ``arg``. e.g.
+
+        .. code-block:: python
+
+            host.batch([
+                {'verb': 'create', 'id': 'PythonContext'},
+                {'verb': 'call', 'id': 'pythonContext1', 'method': 'execute', 'arg': {'code': '6*7'}}
+            ])
+
+        :param operations: A list of operations, or a dictionary with
+                           ``operations`` and ``stop`` properties
+        :param stop: Stop at the first operation that errors, rather than continuing
+                     with the remaining operations
+        :returns: A list with, for each operation run, a dictionary with
+                  either a ``result`` or an ``error``
+        """
+        if isinstance(operations, dict):
+            stop = operations.get('stop', stop)
+            operations = operations.get('operations', [])
+
+        results = []
+        for operation in operations:
+            try:
+                verb = operation.get('verb')
+                id = operation.get('id')
+                arg = operation.get('arg')
+                if verb == 'create':
+                    result = self.create(id, arg or {})
+                elif verb == 'get':
+                    result = self.get(id)
+                elif verb == 'call':
+                    result = self.call(id, operation.get('method'), arg)
+                elif verb == 'delete':
+                    result = self.delete(id)
+                else:
+                    raise Exception('Unknown verb: %s' % verb)
+            except Exception as exc:
+                results.append({'error': str(exc)})
+                if stop:
+                    break
+            else:
+                results.append({'result': result})
+        return results
+
+    def start(self, address='127.0.0.1', port=2000, quiet=False, threaded=False, asynchronous=False,
+              websocket=False, processes=False, warm=0, idle_timeout=None, memory_budget=None,
+              concurrency=None, instance_concurrency=None, queue_size=None, unix=False,
+              single_use_tokens=False):
+        """
+        Start serving this host
+
+        A HTTP server is always started. A `HostWebsocketServer` can also be started
+        (on the next available port after the HTTP server's) for clients that
+        want persistent connections. For clients on the same machine, a `HostHttpServer`
+        can also be started on a unix domain socket, which avoids the overhead of TCP.
+
+        :param threaded: Serve requests concurrently, each in it's own thread.
+                         Instances created while threaded are each pinned to a
+                         dedicated ``ThreadWorker``. Needed for a call to be cancelled
+                         (e.g. ``PythonContext.cancel``) by another HTTP request.
+        :param asynchronous: Serve requests using a ``HostAsyncioServer`` instead
+                             of a ``HostHttpServer`` (Python 3 only). Implies ``threaded``.
+        :param websocket: Also start a ``HostWebsocketServer`` (Python 3 only).
+                          Implies ``threaded``.
+        :param processes: Create instances in worker processes by default. If
+                          a number, the maximum number of worker processes.
+        :param warm: Number of warm worker processes to keep ready for creating
+                     ``PythonContext`` instances in. Implies ``processes`` for ``PythonContext``
+                     instances (but not for other types).
+        :param idle_timeout: Number of seconds after which unused instances are evicted
+        :param memory_budget: Number of bytes of memory that instances can use
+                              before the least recently used are evicted
+        :param concurrency: Maximum number of instance method calls run at once
+        :param instance_concurrency: Maximum number of method calls run at once for each instance
+        :param queue_size: Maximum number of calls waiting for each of these limits, beyond
+                           which calls are rejected
+        :param unix: Also start a ``HostHttpServer`` on a unix domain socket, ``<id>.sock``
+                     in the ``sockets`` subdirectory of ``temp_dir()`` (or, if that path is too
+                     long for a socket, a new directory in ``/tmp``), which is only accessible
+                     by the current user (not available on Windows)
+        :param single_use_tokens: Only accept each request token once (see ``authorize_token()``)
         :returns: self
         """
         if 'http' not in self._servers:
+            threaded = threaded or asynchronous or websocket
+            self._threaded = threaded
+            self._single_use_tokens = single_use_tokens
+            self._processes = bool(processes)
+            if (processes and processes is not True) or warm:
+                self._pool = ProcessPool(None if processes is True else processes, warm)
+            if warm:
+                self._warm_type = self._pool.warm_type
+            self._idle_timeout = idle_timeout
+            self._memory_budget = memory_budget
+            self._limiter = Limiter(concurrency, queue_size) if concurrency else None
+            self._instance_concurrency = instance_concurrency
+            self._queue_size = queue_size
+
             # Start HTTP server
-            server = HostHttpServer(self, address, port)
+            if asynchronous:
+                from .host_asyncio_server import HostAsyncioServer
+                server = HostAsyncioServer(self, address, port)
+            else:
+                server = HostHttpServer(self, address, port, threaded=threaded)
             self._servers['http'] = server
             server.start()
 
+            # Start Websocket server
+            if websocket:
+                from .host_websocket_server import HostWebsocketServer
+                server = HostWebsocketServer(self, address, server._port + 1)
+                self._servers['ws'] = server
+                server.start()
+
+            dir = os.path.join(self.temp_dir(), 'hosts')
+            if not os.path.exists(dir):
+                os.makedirs(dir)
+
+            # Start unix domain socket server
+            if unix:
+                path = self._socket_path()
+                server = HostHttpServer(self, 'unix://' + path, threaded=threaded)
+                self._servers['unix'] = server
+                server.start()
+
             # Record start times
             self._started = datetime.datetime.now()
             self._heartbeat = datetime.datetime.now()
 
             # Register as a running host by creating a run file
-            dir = os.path.join(self.temp_dir(), 'hosts')
-            if not os.path.exists(dir):
-                os.makedirs(dir)
 
             # Write content to a secure file only readable by current user
             # Based on https://stackoverflow.com/a/15015748/4625911
@@ -285,11 +692,24 @@ class Host(object):
             write_secure(self.id + '.json', json.dumps(self.manifest(), indent=True))
             write_secure(self.id + '.key', self._key)
 
+            # Periodically evict instances
+            self._reaper = threading.Event()
+
+            def reap(stopped):
+                while not stopped.wait(self.REAP_INTERVAL):
+                    try:
+                        self.reap()
+                    except Exception:  # pragma: no cover
+                        pass
+            thread = threading.Thread(target=reap, args=(self._reaper,))
+            thread.daemon = True
+            thread.start()
+
             if not quiet:
                 print('Host has started:')
                 print('  Id: %s' % self._id)
                 print('  Key: %s' % self._key)
-                print('  URLs: %s' % self._servers['http'].url)
+                print('  URLs: %s' % ', '.join(server.url for server in self._servers.values()))
 
             # On normal process exit, stop this host
             atexit.register(self.stop)
@@ -300,26 +720,67 @@ class Host(object):
 
         :returns: self
         """
-        server = self._servers.get('http')
-        if server:
-            server.stop()
-            del self._servers['http']
+        if 'http' in self._servers:
+            for server in self._servers.values():
+                server.stop()
+            self._servers = {}
+            self._threaded = False
+            self._single_use_tokens = False
+            self._processes = False
+            self._warm_type = None
+            self._pool.stop()
+            self._limiter = None
+            self._instance_concurrency = None
+            self._reaper.set()
 
             # Deregister as a running host
             for filename in [self.id + '.json', self.id + '.key']:
                 path = os.path.join(self.temp_dir(), 'hosts', filename)
                 if os.path.exists(path):
                     os.remove(path)
+            if self._socket_dir:
+                shutil.rmtree(self._socket_dir, ignore_errors=True)
+                self._socket_dir = None
 
             if not quiet:
                 print('Host has stopped')
 
-    def run(self, address='127.0.0.1', port=2000):
+    def _socket_path(self):
+        """
+        Get the path for this host's unix domain socket
+
+        The socket is created in a directory which is only accessible by the current user
+        (rather than changing the process's ``umask`` while it is created, which would affect
+        files created by other threads).
+
+        :returns: A filesystem path
+        """
+        dir = os.path.join(self.temp_dir(), 'sockets')
+        path = os.path.join(dir, self.id + '.sock')
+        if len(path.encode('utf-8')) <= self.SOCKET_PATH_MAX:
+            if not os.path.exists(dir):
+                os.makedirs(dir, 0o700)
+            os.chmod(dir, 0o700)
+            return path
+
+        # The temporary directory can be too long (e.g. on macOS, where `$TMPDIR` is
+        # under `/var/folders/`) so fallback to a new, private, directory in `/tmp`
+        dir = tempfile.mkdtemp(prefix='stencila-', dir='/tmp' if os.path.isdir('/tmp') else None)
+        path = os.path.join(dir, self.id + '.sock')
+        if len(path.encode('utf-8')) > self.SOCKET_PATH_MAX:
+            os.rmdir(dir)
+            raise RuntimeError('Path for unix domain socket is too long: %s' % path)
+        self._socket_dir = dir
+        return path
+
+    def run(self, address='127.0.0.1', port=2000, **kwargs):
         """
         Start serving this host and wait for connections
         indefinitely
+
+        Any additional keyword arguments are passed on to ``start()``.
         """
-        self.start(address=address, port=port)
+        self.start(address=address, port=port, **kwargs)
 
         print('Use Ctrl+C to stop')
 
@@ -330,8 +791,15 @@ class Host(object):
                 self.stop()
                 break
 
-    def spawn(self):
-        self.start(quiet=True)
+    def spawn(self, **kwargs):
+        """
+        Start serving this host, print it's details to stdout
+        and wait for connections indefinitely
+
+        Used by peers to spawn a new host process.
+        Any keyword arguments are passed on to ``start()``.
+        """
+        self.start(quiet=True, **kwargs)
 
         print(json.dumps({
             "id": self.id,
@@ -356,8 +824,10 @@ class Host(object):
         """
         Get a list of servers for this host.
 
-        Currenty, only a `HostHttpServer` is implemented but in the
-        future onther servers for a host may be added (e.g. `HostWebsocketServer`)
+        Always includes a ``http`` server (a `HostHttpServer` or a `HostAsyncioServer`),
+        if started with ``websocket=True``, a ``ws`` server (a `HostWebsocketServer`), and
+        if started with ``unix=True``, a ``unix`` server (a `HostHttpServer` on a unix domain
+        socket, with the ``path`` of the socket).
 
         :returns: A dictionary of server details
         """
@@ -367,26 +837,35 @@ class Host(object):
             servers[name] = {
                 'url': server.url
             }
+            if getattr(server, 'path', None):
+                servers[name]['path'] = server.path
         return servers
 
     def generate_token(self, host=None):
         """
         Generate a request token.
 
+        :param host: Id of a peer host to generate a token for. The peer's key is read
+                     from the key file that it writes when started (see ``start()``), which
+                     is only readable by the current user.
         :returns: A JWT token string
         """
         if host is None:
             key = self.key
         else:
-            # TODO Support token generation for peers based on held keys
-            raise RuntimeError('Generation of tokens for peer hosts is not yet supported')
+            path = os.path.join(self.temp_dir(), 'hosts', host + '.key')
+            try:
+                with open(path) as file:
+                    key = file.read()
+            except (IOError, OSError):
+                raise RuntimeError('No key held for peer host: %s' % host)
 
         now = datetime.datetime.utcnow()
         payload = {
             'iat': now,
             'exp': now + datetime.timedelta(seconds=300),
             'iss': self.id,
-            'jit': binascii.hexlify(os.urandom(32)).decode()
+            'jti': binascii.hexlify(os.urandom(32)).decode()
         }
         return jwt.encode(payload, key, algorithm='HS256').decode('utf-8')
 
@@ -394,16 +873,94 @@ class Host(object):
         """
         Authorize a request token.
 
-        Throws an error if the token is invalid.
+        Throws an error if the token is invalid. Tokens must expire (the `exp` claim)
+        and be issued by a host (the `iss` claim).
+
+        Verified tokens are cached (up to ``TOKEN_CACHE_SIZE`` of the most recently
+        used) until they expire so that clients can reuse a token without each request
+        paying for signature verification. The `jti` (JWT ID) of each verified token is
+        recorded until it expires and any other token presenting the same `jti` is
+        rejected as a replay.
+
+        If the host was started with ``single_use_tokens``, each token must have a `jti`
+        and can only be used once. Clients should then use the session issued after
+        their first request (see ``generate_session()``) for later requests.
 
         :param token: A JWT token string
         """
+        now = time.time()
+        if not self._single_use_tokens:
+            with self._lock:
+                payload = self._tokens.pop(token, None)
+                if payload is not None:
+                    if payload['exp'] > now:
+                        # Reinsert to mark as most recently used
+                        self._tokens[token] = payload
+                        return payload
+                    raise jwt.ExpiredSignatureError('Signature has expired')
+
         payload = jwt.decode(token, self.key, algorithms=['HS256'])
 
-        # TODO Check and store `iss` and `jti` to prevent replay attacks
+        if 'exp' not in payload:
+            raise jwt.InvalidTokenError('Token has no expiry')
+        if not re.match(self.ISSUER_PATTERN, str(payload.get('iss', ''))):
+            raise jwt.InvalidIssuerError('Token has an invalid issuer')
+        jti = payload.get('jti')
+        if not jti and self._single_use_tokens:
+            raise jwt.InvalidTokenError('Token has no ID')
+
+        with self._lock:
+            if jti:
+                used = self._jtis.get(jti)
+                if used and used[1] > now and (self._single_use_tokens or used[0] != token):
+                    raise jwt.InvalidTokenError('Token ID has already been used')
+                self._jtis[jti] = (token, payload['exp'])
+
+            if not self._single_use_tokens:
+                self._tokens[token] = payload
+                if len(self._tokens) > self.TOKEN_CACHE_SIZE:
+                    # Evict the least recently used token
+                    self._tokens.popitem(last=False)
+            if len(self._jtis) > self.TOKEN_CACHE_SIZE:
+                # Forget the IDs of tokens that have expired (and so will be rejected anyway)
+                self._jtis = dict(
+                    (jti, used) for jti, used in self._jtis.items() if used[1] > now
+                )
 
         return payload
 
+    def generate_session(self):
+        """
+        Generate a session token.
+
+        Session tokens are longer lived than request tokens (see ``SESSION_LIFETIME``)
+        and are issued to clients (e.g. as a cookie) after they have been authorized
+        using a request token.
+
+        :returns: A session token string
+        """
+        session = binascii.hexlify(os.urandom(32)).decode()
+        with self._lock:
+            now = time.time()
+            self._sessions = dict(
+                (session, expires) for session, expires in self._sessions.items() if expires > now
+            )
+            self._sessions[session] = now + self.SESSION_LIFETIME
+        return session
+
+    def authorize_session(self, session):
+        """
+        Authorize a session token.
+
+        Throws an error if the session token is unknown or has expired.
+
+        :param session: A session token string
+        """
+        expires = self._sessions.get(session)
+        if expires is None or expires <= time.time():
+            raise Exception('Invalid session')
+        return True
+
     def view(self):  # pragma: no cover
         """
         View this host in the browser
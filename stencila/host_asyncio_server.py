@@ -0,0 +1,238 @@
+"""
+An asyncio based HTTP server for a Host (Python 3 only)
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import sys
+import threading
+from urllib.parse import unquote_to_bytes
+
+from werkzeug.wrappers import Request
+
+from .host_http_server import HostHttpServer
+
+
+class HostAsyncioServer(HostHttpServer):
+    """
+    An asyncio based HTTP server for a Host
+
+    Provides the same REST-like HTTP protocol, and uses the same routing and request
+    handling, as ``HostHttpServer``. However, connections are managed by an ``asyncio``
+    event loop so that idle, or long-polling, clients do not each hold a thread.
+    Requests are only handed off to a thread (from a bounded pool of ``workers``) while
+    they are being handled, which is when any blocking ``Host`` methods (e.g. ``call``)
+    get run. Response bodies are written to the connection as they are generated.
+
+    Because requests are handled in multiple threads, the host should pin instances
+    to their own threads (i.e. be started with ``threaded=True``). This is done
+    automatically by ``Host.start(asynchronous=True)``.
+    """
+
+    def __init__(self, host, address='127.0.0.1', port=2000, workers=None):
+        HostHttpServer.__init__(self, host, address, port, threaded=True)
+        self._workers = workers
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        # Tasks handling open connections
+        self._connections = set()
+
+    def start(self, real=True):
+        """
+        Start the server
+        """
+        if real:
+            self._loop = asyncio.new_event_loop()
+            while self._port < 65535:
+                try:
+                    self._server = self._loop.run_until_complete(
+                        asyncio.start_server(self._accept, self._address, self._port)
+                    )
+                except OSError as exc:  # pragma: no cover
+                    if exc.errno == 98:
+                        self._port += 10
+                    else:
+                        raise
+                else:
+                    break
+            self._executor = ThreadPoolExecutor(self._workers)
+            self._thread = threading.Thread(target=self._loop.run_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self, real=True):
+        """
+        Stop the server
+        """
+        if self._server:
+            server = self._server
+            self._server = None
+
+            async def close():
+                server.close()
+                # Cancel the handling of any open (e.g. keep-alive) connections
+                tasks = list(self._connections)
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await server.wait_closed()
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._executor.shutdown(wait=False)
+        return self
+
+    def _accept(self, reader, writer):
+        """
+        Accept a connection, handling it in a task which is cancelled if the server is stopped
+        """
+        task = self._loop.create_task(self._connection(reader, writer))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+
+    async def _connection(self, reader, writer):
+        """
+        Handle a connection, which may carry several requests
+        """
+        try:
+            keep_alive = True
+            while keep_alive:
+                environ = await self._read(reader, writer)
+                if environ is None:
+                    break
+                keep_alive = await self._respond(environ, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read(self, reader, writer):
+        """
+        Read a request and create a WSGI environment for it
+        """
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            return await self._reject(writer)
+        verb, target, protocol = parts
+
+        headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+
+        path, _, query = target.partition('?')
+        server = writer.get_extra_info('sockname')
+        peer = writer.get_extra_info('peername')
+        environ = {
+            'REQUEST_METHOD': verb.upper(),
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self._address,
+            'SERVER_PORT': str(server[1] if isinstance(server, tuple) else self._port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': peer[0] if isinstance(peer, tuple) else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return await self._reject(writer)
+        body = await reader.readexactly(length) if length > 0 else b''
+        environ['wsgi.input'] = BytesIO(body)
+        return environ
+
+    async def _reject(self, writer):
+        """
+        Respond to a malformed request, after which the connection is closed
+        """
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        return None
+
+    async def _respond(self, environ, writer):
+        """
+        Handle a request in the executor and write the response
+
+        :returns: Whether or not the connection can be kept alive
+        """
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(self._executor, self.handle, Request(environ))
+
+        status_headers = []
+
+        def start_response(status, headers, exc_info=None):
+            status_headers[:] = [status, headers]
+
+        body = response(environ, start_response)
+        status, headers = status_headers
+
+        protocol = environ['SERVER_PROTOCOL']
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        if protocol == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+        sized = any(name.lower() == 'content-length' for name, value in headers)
+        chunked = not sized and protocol == 'HTTP/1.1'
+        if not sized and not chunked:
+            keep_alive = False
+
+        head = ['%s %s' % (protocol, status)]
+        head.extend('%s: %s' % header for header in headers)
+        if chunked:
+            head.append('Transfer-Encoding: chunked')
+        head.append('Connection: %s' % ('keep-alive' if keep_alive else 'close'))
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+        try:
+            # Bodies of unknown size may be generated as they are iterated over
+            # (e.g. JSON being encoded) so do that in the executor
+            chunks = iter(body)
+            while True:
+                if sized:
+                    chunk = next(chunks, None)
+                else:
+                    chunk = await loop.run_in_executor(self._executor, next, chunks, None)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                if chunked:
+                    writer.write(b'%x\r\n' % len(chunk) + chunk + b'\r\n')
+                else:
+                    writer.write(chunk)
+                await writer.drain()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+        return keep_alive
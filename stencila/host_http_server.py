@@ -1,18 +1,73 @@
+import base64
+import cProfile
+import datetime
+import hashlib
+import itertools
 import json
 import logging
 import os
 import six
-from six.moves import socketserver
+from six.moves import queue, socketserver
+from six.moves.urllib.parse import quote
 from io import BytesIO, StringIO
 import random
 import re
+import socket
 import string
 import threading
+import time
+import timeit
 import traceback
 import mimetypes
+import zlib
 
 from werkzeug.wrappers import Request, Response
-from werkzeug.serving import BaseWSGIServer
+from werkzeug.serving import BaseWSGIServer, ThreadedWSGIServer, WSGIRequestHandler
+
+from . import binary
+from .admission import Overloaded
+
+# Directory of static files
+STATIC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'static'))
+
+# Maximum number of bytes of static files (and their gzipped variants) to cache in memory
+STATIC_CACHE_SIZE = 16 * 1024 * 1024
+
+# Number of seconds that browsers can cache static files for before revalidating them
+STATIC_MAX_AGE = 60 * 60
+
+# Non-text content types of static files that are worth compressing
+COMPRESSIBLE_TYPES = ('application/javascript', 'application/json', 'image/svg+xml')
+
+# Minimum number of bytes in a response body before it is compressed
+COMPRESSION_THRESHOLD = 8 * 1024
+
+# Compression levels for responses by route: a host method, or for `call`,
+# `call!<method>` (e.g. `call!execute`), with `*` for all other routes
+COMPRESSION_LEVELS = {
+    'call!execute': 6,
+    'call!fetch': 6,
+    'batch': 6,
+    '*': 1
+}
+
+# Number of bytes of a response body to compress at a time
+COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+# Number of characters of JSON to encode before sending it as part of a response body
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Number of items of long lists to encode at a time
+JSON_SLICE_SIZE = 10000
+
+# Maximum number of profile files to keep (the oldest are removed)
+PROFILES_KEPT = 100
+
+# Number of seconds that an idle persistent connection is kept open for
+KEEP_ALIVE_TIMEOUT = 5
+
+# Maximum number of requests on a persistent connection before it is closed
+KEEP_ALIVE_REQUESTS = 1000
 
 
 class HostHttpServer(object):
@@ -21,7 +76,13 @@ class HostHttpServer(object):
 
     Provides access to a ``Host`` via a REST-like HTTP protocol using ``POST`` to
     create new instance and ``PUT`` to run one of it's methods. Implements authorization
-    using single-, or multi-, use "tickets" and session tokens.
+    using request tokens (JWTs sent in a ``Authorization: Bearer`` header) and
+    session tokens (sent as a ``session`` cookie after the first authorized request).
+
+    A request token can be reused until it expires, but clients should prefer to send
+    the session cookie once they have one. If the host is started with
+    ``single_use_tokens=True`` each request token is only accepted once, so clients
+    must use the session cookie for every request after the first.
 
     The following example illustrates creating a ``PythonContext`` and then
     running it's ``execute`` method. It uses the ``http`` command line tool (https://httpie.org/)
@@ -66,20 +127,54 @@ class HostHttpServer(object):
 
     """
 
-    def __init__(self, host, address='127.0.0.1', port=2000):
+    def __init__(self, host, address='127.0.0.1', port=2000, threaded=False,
+                 compression_threshold=COMPRESSION_THRESHOLD, compression_levels=None,
+                 keep_alive=None, keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+                 keep_alive_requests=KEEP_ALIVE_REQUESTS):
         self._host = host
         self._address = address
         self._port = port
+        self._threaded = threaded
+        # Persistent connections are only used by default when threaded because,
+        # otherwise, one idle connection would block all others
+        self._keep_alive = threaded if keep_alive is None else keep_alive
+        self._keep_alive_timeout = keep_alive_timeout
+        self._keep_alive_requests = keep_alive_requests
+        self._compression_threshold = compression_threshold
+        self._compression_levels = dict(COMPRESSION_LEVELS, **(compression_levels or {}))
         self._server = None
+        self._static = {}
+        self._static_size = 0
 
     @property
     def url(self):
         """
         Get the URL of the server
 
+        For a server on a unix domain socket, a ``http+unix`` URL with the
+        percent-encoded path of the socket.
+
         :returns: A URL string
         """
-        return 'http://%s:%s' % (self._address, self._port) if self._server else None
+        if not self._server:
+            return None
+        if self.path:
+            return 'http+unix://%s' % quote(self.path, safe='')
+        return 'http://%s:%s' % (self._address, self._port)
+
+    @property
+    def path(self):
+        """
+        Get the path of the server's unix domain socket
+
+        A server listens on a unix domain socket, instead of TCP, if it's
+        ``address`` is of the form ``unix://<path>``.
+
+        :returns: A filesystem path (or ``None``)
+        """
+        if self._address.startswith('unix://'):
+            return self._address[7:]
+        return None
 
     def start(self, real=True):
         """
@@ -105,11 +200,20 @@ class HostHttpServer(object):
         if real:
             while self._port < 65535:
                 try:
-                    # Do not use a threaded server because (amongst possible other issues)
-                    # a SQLte connection can only be used from within the same thread
-                    self._server = BaseWSGIServer(
-                        self._address, self._port, self
+                    # Only use a threaded server if asked to. Amongst possible other issues,
+                    # a SQLite connection can only be used from within the same thread so the
+                    # host needs to pin each instance to it's own thread (see `ThreadWorker`)
+                    Server = ThreadedWSGIServer if self._threaded else BaseWSGIServer
+                    self._server = Server(
+                        self._address, self._port, self,
+                        handler=HostRequestHandler if self._keep_alive else None
                     )
+                    if self.path:
+                        # Make any unix domain socket only accessible by the current user
+                        # (it should also be in a directory only accessible by them)
+                        os.chmod(self.path, 0o600)
+                    self._server.keep_alive_timeout = self._keep_alive_timeout
+                    self._server.keep_alive_requests = self._keep_alive_requests
                 except socketserver.socket.error as exc: # pragma: no cover
                     if exc.args[0] == 98:
                         self._port += 10
@@ -128,7 +232,10 @@ class HostHttpServer(object):
         """
         if self._server:
             self._server.shutdown()
+            self._server.server_close()
             self._server = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
         return self
 
     def __call__(self, environ, start_response):
@@ -137,20 +244,73 @@ class HostHttpServer(object):
         """
         request = Request(environ)
         response = self.handle(request)
+
+        if self._keep_alive:
+            # Discard any unread request body so that the next
+            # request on the connection can be read
+            while request.stream.read(JSON_CHUNK_SIZE):
+                pass
+
+            # Frame bodies of unknown length using chunked encoding so that
+            # the connection does not need to be closed to mark their end
+            if (
+                environ.get('SERVER_PROTOCOL') == 'HTTP/1.1' and
+                response.content_length is None and
+                response.status_code not in (204, 304) and
+                request.method != 'HEAD'
+            ):
+                response.headers['Transfer-Encoding'] = 'chunked'
+                response.response = chunked(response.iter_encoded())
+
         return response(environ, start_response)
 
     def handle(self, request):
         """
         Handle a HTTP request
+
+        Records the number and duration of requests in the host's metrics.
+        """
+        start = timeit.default_timer()
+        request.environ['stencila.received'] = time.time()
+        response = self.dispatch(request)
+        self._host.metrics.request(
+            request.environ.get('stencila.route', 'none'),
+            response.status_code,
+            timeit.default_timer() - start
+        )
+        return response
+
+    def dispatch(self, request):
+        """
+        Authorize and route a HTTP request to a method
         """
         response = Response()
         try:
+            # Determine the origin of the request, used to decide whether to accept a session
+            # cookie and whether to add CORS headers used to control access by browsers. In particular,
+            # CORS can prevent access by XHR requests made by Javascript in third party sites.
+            # See https://developer.mozilla.org/en-US/docs/Web/HTTP/Access_control_CORS
+
+            # Get the Origin header (sent in CORS and POST requests) and fall back to Referer header
+            # if it is not present (either of these should be present in most browser requests)
+            origin = request.headers.get('Origin')
+            if not origin and request.headers.get('Referer'):
+                match = re.match(r'^[^:/]+://[^/]+', request.headers.get('Referer'))
+                if match:
+                    origin = match.group(0)
+
+            # Check that host is in whitelist
+            sent_origin = origin
+            if origin and not self.allowed_origin(origin):
+                origin = None
+
             # Check authorization
             authorized = False
             if not self._host.key:
                 authorized = True
             else:
                 auth_header = request.headers.get('Authorization')
+                session = request.cookies.get('session')
                 if auth_header:
                     match = re.match(r'^Bearer (.+)', auth_header)
                     if match:
@@ -161,29 +321,19 @@ class HostHttpServer(object):
                             return self.error403(request, response, str(exc))
                         else:
                             authorized = True
-
-            # Add CORS headers used to control access by browsers. In particular, CORS
-            # can prevent access by XHR requests made by Javascript in third party sites.
-            # See https://developer.mozilla.org/en-US/docs/Web/HTTP/Access_control_CORS
-
-            # Get the Origin header (sent in CORS and POST requests) and fall back to Referer header
-            # if it is not present (either of these should be present in most browser requests)
-            origin = request.headers.get('Origin')
-            if not origin and request.headers.get('Referer'):
-                match = re.match(r'^https?://([\w.]+)(:\d+)?', request.headers.get('Referer'))
-                if match:
-                    origin = match.group(0)
-
-            # Check that host is in whitelist
-            if origin:
-                match = re.match(r'^https?://([\w.]+)(:\d+)?', origin)
-                if match:
-                    host = match.group(1)
-                    match = re.match(r'^((127\.0\.0\.1)|(localhost)|(([^.]+\.)?stenci\.la))$', host)
-                    if not match:
-                        origin = None
-                else:
-                    origin = None
+                            # Issue a session token so that the client can make subsequent
+                            # requests without needing a new request token
+                            if not self._valid_session(session):
+                                response.set_cookie(
+                                    'session', self._host.generate_session(),
+                                    max_age=self._host.SESSION_LIFETIME, httponly=True,
+                                    samesite='Strict'
+                                )
+                elif session:
+                    # Browsers send the session cookie with requests made by any site
+                    # so only accept it for requests from allowed origins (or with no origin
+                    # e.g. from non-browser clients)
+                    authorized = self._valid_session(session) and not (sent_origin and not origin)
 
             # If an origin has been found and is authorized set CORS headers
             # Without these headers browser XHR request get an error like:
@@ -213,16 +363,43 @@ class HostHttpServer(object):
                 # Route request to a method
                 endpoint = self.route(request.method, request.path, authorized)
                 if not endpoint:
-                    return self.error400()
+                    return self.error400(request, response)
 
                 method_name = endpoint[0]
                 method_args = endpoint[1:]
+                request.environ['stencila.route'] = method_args[0] if method_name == 'run' else method_name
                 method = getattr(self, method_name)
                 response = method(request, response, *method_args)
                 return response
+        except Overloaded as exc:
+            return self.error503(request, response, str(exc), exc.retry_after)
         except Exception as exc:
             return self.error500(request, response)
 
+    @staticmethod
+    def allowed_origin(origin):
+        """
+        Is an origin (e.g. from an ``Origin`` header) allowed to access the host?
+
+        :param origin: The origin e.g. ``http://localhost:3000``
+        :returns: A boolean
+        """
+        match = re.match(r'^https?://([\w.]+)(:\d+)?$', origin)
+        if not match:
+            return False
+        return bool(re.match(r'^((127\.0\.0\.1)|(localhost)|(([^.]+\.)?stenci\.la))$', match.group(1)))
+
+    def _valid_session(self, session):
+        """
+        Is a session token valid?
+        """
+        if not session:
+            return False
+        try:
+            return self._host.authorize_session(session)
+        except Exception:
+            return False
+
     def route(self, verb, path, authorized=False):
         """
         Route a HTTP request
@@ -233,9 +410,14 @@ class HostHttpServer(object):
             return ('static', path[8:])
         if path == '/manifest':
             return ('run', 'manifest')
+        if path == '/metrics':
+            return ('metrics',)
 
         if not authorized: return ('error401', path)
 
+        if path == '/batch' and verb == 'POST':
+            return ('run', 'batch')
+
         if path[:9] == '/environ/':
             if verb == 'POST':
                 return ('run', 'startup', path[9:])
@@ -260,31 +442,333 @@ class HostHttpServer(object):
     def static(self, request, response, path):
         """
         Handle a GET request for a static file
+
+        Files are served from an in-memory cache (see ``static_asset``) with
+        ``ETag``, ``Last-Modified`` and ``Cache-Control`` headers so that browsers
+        can avoid refetching them. Conditional (``If-None-Match``, ``If-Modified-Since``)
+        requests are answered with ``304 Not Modified`` and ``Range`` requests
+        with ``206 Partial Content``. If the client accepts it, and the request is
+        not for a range, a pre-gzipped variant of the file is served.
         """
-        static_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'static'))
-        requested_path = os.path.abspath(os.path.join(static_path, path))
-        if os.path.commonprefix([static_path, requested_path]) != static_path:
+        requested_path = os.path.abspath(os.path.join(STATIC_PATH, path))
+        if os.path.commonprefix([STATIC_PATH, requested_path]) != STATIC_PATH:
             return self.error403(request, response)
-        elif not os.path.exists(requested_path):
+
+        asset = self.static_asset(requested_path)
+        if asset is None:
             return self.error404(request, response)
+
+        if asset['gzip'] and 'gzip' in request.accept_encodings and 'Range' not in request.headers:
+            response.set_data(asset['gzip'])
+            response.headers['Content-Encoding'] = 'gzip'
+            response.set_etag(asset['etag'] + '-gzip')
         else:
-            response.set_data(open(requested_path).read())
-            response.headers['Content-Type'] = mimetypes.guess_type(path)[0]
-            return response
+            response.set_data(asset['data'])
+            response.set_etag(asset['etag'])
+        response.headers['Content-Type'] = asset['type']
+        response.headers['Cache-Control'] = 'public, max-age=%d' % STATIC_MAX_AGE
+        response.vary.add('Accept-Encoding')
+        response.last_modified = asset['modified']
+        return response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+
+    def static_asset(self, path):
+        """
+        Get a static file from the cache, reading it if necessary
+
+        Files are read into the cache when first requested, until the cache
+        reaches ``STATIC_CACHE_SIZE`` bytes, after which they are read on each request.
+
+        :param path: Absolute path of the file
+        :returns: A dictionary with the file's ``data``, ``gzip`` (a gzipped
+                  variant, if compressible), ``etag``, ``modified`` time and
+                  content ``type``; or ``None`` if the file does not exist
+        """
+        asset = self._static.get(path)
+        if asset:
+            return asset
+
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        gzipped = None
+        if mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            gzipped = compressor.compress(data) + compressor.flush()
+            if len(gzipped) >= len(data):
+                gzipped = None
+
+        asset = {
+            'data': data,
+            'gzip': gzipped,
+            'etag': hashlib.sha1(data).hexdigest(),
+            'modified': datetime.datetime.utcfromtimestamp(int(os.path.getmtime(path))),
+            'type': mimetype
+        }
+
+        size = len(data) + len(gzipped or b'')
+        if self._static_size + size <= STATIC_CACHE_SIZE:
+            self._static[path] = asset
+            self._static_size += size
+        return asset
 
     def run(self, request, response, method, *args):
         """
         Run a host method
+
+        Request and response bodies are JSON unless a binary format (see the ``binary`` module)
+        is used for the request (in it's ``Content-Type`` header) or preferred for the response
+        (in the ``Accept`` header).
         """
         args = list(args)
         if request.data:
-            arg = json.loads(request.data.decode())
+            # Browsers allow any site to send some content types (e.g. `text/plain` from
+            # forms), with cookies, so only JSON and binary bodies are accepted
+            if request.mimetype and request.mimetype != 'application/json' and \
+                    request.mimetype not in binary.MEDIA_TYPES:
+                return self.error415(request, response)
+            try:
+                if request.mimetype in binary.MEDIA_TYPES:
+                    arg = binary.decode(request.data)
+                else:
+                    arg = json.loads(request.data.decode())
+            except ValueError as exc:
+                return self.error400(request, response, 'Invalid request body: %s' % exc)
             args.append(arg)
-        result = getattr(self._host, method)(*args)
-        data = to_json(result)
+        if method == 'call':
+            try:
+                deadline = self.deadline(request)
+            except ValueError:
+                return self.error400(request, response, 'Invalid deadline')
+            if request.accept_mimetypes.best == 'text/event-stream':
+                return self.stream(request, response, *args, deadline=deadline)
+            elif request.headers.get('X-Stencila-Profile') or request.args.get('profile'):
+                result = self.profile(response, *args, deadline=deadline)
+            else:
+                result = self._host.call(*args, deadline=deadline)
+        else:
+            result = getattr(self._host, method)(*args)
 
-        response.set_data(data)
-        response.headers['Content-Type'] = 'application/json'
+        response.vary.add('Accept')
+        if request.accept_mimetypes.best_match(('application/json',) + binary.MEDIA_TYPES) in binary.MEDIA_TYPES:
+            chunks = iter([binary.encode(result)])
+            response.headers['Content-Type'] = binary.MEDIA_TYPE
+        else:
+            chunks = iter_json(result)
+            response.headers['Content-Type'] = 'application/json'
+
+        # Responses that fit within one chunk are sent with a `Content-Length`,
+        # larger responses are encoded as they are sent
+        if method == 'call':
+            chunks = self._measure(chunks, args[0], args[1])
+        first = next(chunks, b'')
+        second = next(chunks, None)
+        if second is None:
+            response.set_data(first)
+        else:
+            response.response = itertools.chain([first, second], chunks)
+
+        route = 'call!%s' % args[1] if method == 'call' else method
+        level = self._compression_levels.get(route, self._compression_levels.get('*', 0))
+        return self.compress(request, response, level)
+
+    def stream(self, request, response, name, method, arg=None, deadline=None):
+        """
+        Call an instance method and stream events as Server-Sent Events
+
+        Used for calls with an ``Accept: text/event-stream`` header. Events emitted
+        by the method while it is running (e.g. ``stdout`` from ``PythonContext.execute``)
+        are sent as they happen, followed by a ``result`` event with the result of the
+        method (or an ``error`` event). Each event's data is JSON. Methods that do not emit
+        events (including those of instances in worker processes) are called on the
+        request's thread and only the ``result`` is sent.
+
+        The stream is only started once the call has been admitted, so that a call
+        which can not be started by its deadline is rejected with a ``503`` response.
+        """
+        try:
+            streams = getattr(getattr(self._host.get(name), method, None), 'streams', False)
+        except Exception:
+            streams = False
+
+        def send(items):
+            for event, data in items:
+                yield ('event: %s\ndata: %s\n\n' % (event, to_json(data))).encode()
+
+        if streams:
+            events = queue.Queue()
+            started = queue.Queue()
+
+            def emit(event, data):
+                events.put((event, data))
+
+            def call():
+                admitted = []
+
+                def admit():
+                    admitted.append(True)
+                    started.put(None)
+                try:
+                    result = self._host.call(name, method, arg, deadline=deadline, emit=emit, admitted=admit)
+                except Exception as exc:
+                    if not admitted:
+                        started.put(exc)
+                        return
+                    events.put(('error', {'message': str(exc)}))
+                else:
+                    events.put(('result', result))
+                events.put(None)
+            thread = threading.Thread(target=call)
+            thread.daemon = True
+            thread.start()
+
+            error = started.get()
+            if isinstance(error, Overloaded):
+                raise error
+            elif error:
+                items = [('error', {'message': str(error)})]
+            else:
+                items = iter(events.get, None)
+        else:
+            # Called on this thread so that instances which can only be used on the thread
+            # that created them (e.g. ``SqliteContext`` when the host is not threaded) work
+            try:
+                items = [('result', self._host.call(name, method, arg, deadline=deadline))]
+            except Overloaded:
+                raise
+            except Exception as exc:
+                items = [('error', {'message': str(exc)})]
+
+        response.response = send(items)
+        response.headers['Content-Type'] = 'text/event-stream'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def deadline(self, request):
+        """
+        Get the deadline for a request
+
+        Clients can set a ``X-Stencila-Deadline`` header with the number of seconds,
+        from when the request is received, within which the call must be started.
+        Because a host that is not threaded only receives a request once it has finished
+        the ones before it, time spent waiting for those is not counted. Clients can
+        instead set a ``X-Stencila-Deadline-At`` header with the time (seconds since the epoch)
+        by which the call must be started (the earlier is used if both are set).
+        If the host is too busy to start the call by then, the request is rejected with
+        a ``503 Service Unavailable`` response (with a ``Retry-After`` header).
+
+        :returns: Time (seconds since the epoch), or ``None``
+        """
+        deadlines = []
+        seconds = request.headers.get('X-Stencila-Deadline')
+        if seconds:
+            deadlines.append(request.environ.get('stencila.received', time.time()) + float(seconds))
+        at = request.headers.get('X-Stencila-Deadline-At')
+        if at:
+            deadlines.append(float(at))
+        return min(deadlines) if deadlines else None
+
+    def profile(self, response, name, method, arg=None, deadline=None):
+        """
+        Call an instance method with profiling
+
+        Profiling is requested using a ``X-Stencila-Profile`` header or a ``profile`` query
+        parameter. Because it is only available for calls it is only available to authorized
+        clients. The profile statistics are saved to a file, in the ``profiles`` subdirectory
+        of the host's temporary directory, which can be read using ``pstats.Stats``. The path
+        of the file is returned in the ``X-Stencila-Profile`` header of the response.
+        Only the most recent ``PROFILES_KEPT`` files are kept.
+        """
+        profiler = cProfile.Profile()
+        try:
+            return self._host.call(name, method, arg, profiler=profiler, deadline=deadline)
+        finally:
+            dir = os.path.join(self._host.temp_dir(), 'profiles')
+            if not os.path.exists(dir):
+                os.makedirs(dir)
+            path = os.path.join(dir, '%s-%s-%s.prof' % (
+                name, method, datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+            ))
+            profiler.dump_stats(path)
+            response.headers['X-Stencila-Profile'] = path
+            self._prune_profiles(dir)
+
+    def _prune_profiles(self, dir):
+        """
+        Remove all but the most recent ``PROFILES_KEPT`` profile files
+        """
+        paths = []
+        for file in os.listdir(dir):
+            path = os.path.join(dir, file)
+            try:
+                paths.append((os.path.getmtime(path), path))
+            except OSError:
+                # Removed by a concurrent request
+                pass
+        paths.sort()
+        for mtime, path in paths[:-PROFILES_KEPT]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _measure(self, chunks, name, method):
+        """
+        Record the size of the result of a call as it is sent
+        """
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+        self._host.metrics.call_size(self._host.instance_type(name), method, size)
+
+    def metrics(self, request, response):
+        """
+        Handle a GET request for the host's metrics
+        """
+        response.set_data(self._host.metrics.render())
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return response
+
+    def compress(self, request, response, level=6):
+        """
+        Compress the body of a response if the client accepts it
+
+        Responses are only compressed if their body is larger than the server's
+        ``compression_threshold`` (or of unknown length). The body is compressed
+        in chunks, as it is sent, rather than all at once.
+
+        :param level: The compression level (0 for no compression, 1 for fastest,
+                      to 9 for most compressed)
+        """
+        if level <= 0 or 'Content-Encoding' in response.headers:
+            return response
+        length = response.content_length
+        if length is not None and length < self._compression_threshold:
+            return response
+
+        encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+        if not encoding:
+            return response
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+
+        body = response.iter_encoded()
+
+        def compressed():
+            compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+            for chunk in body:
+                for start in range(0, len(chunk), COMPRESSION_CHUNK_SIZE):
+                    piece = compressor.compress(chunk[start:start + COMPRESSION_CHUNK_SIZE])
+                    if piece:
+                        yield piece
+            yield compressor.flush()
+
+        response.response = compressed()
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
         return response
 
     def error(self, request, response, code, name, what = ''):
@@ -305,6 +789,13 @@ class HostHttpServer(object):
     def error404(self, request, response, what = ''):
         return self.error(request, response, 404, 'Not found', what)
 
+    def error415(self, request, response, what=''):
+        return self.error(request, response, 415, 'Unsupported media type', what)
+
+    def error503(self, request, response, what='', retry_after=1):
+        response.headers['Retry-After'] = str(int(retry_after))
+        return self.error(request, response, 503, 'Service unavailable', what)
+
     def error500(self, request, response):
         stream = StringIO() if six.PY3 else BytesIO()
         traceback.print_exc(file=stream)
@@ -312,28 +803,212 @@ class HostHttpServer(object):
         return self.error(request, response, 500, 'Internal error', trace)
 
 
+class HostRequestHandler(WSGIRequestHandler):
+    """
+    A request handler which keeps connections alive
+
+    Responds using HTTP/1.1 so that clients can send many requests over the one
+    connection. Responses are framed using either a ``Content-Length`` header or,
+    for bodies of unknown length, chunked encoding (see ``HostHttpServer.__call__``).
+    Connections are closed after being idle for the server's ``keep_alive_timeout``
+    seconds, or after ``keep_alive_requests`` requests.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.timeout = self.server.keep_alive_timeout
+        WSGIRequestHandler.setup(self)
+        self.requests = 0
+        # Headers and body are written separately so disable Nagle's algorithm
+        # to avoid each response being delayed waiting for the client's ACK
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle_one_request(self):
+        self.requests += 1
+        self.chunked = False
+        return WSGIRequestHandler.handle_one_request(self)
+
+    def parse_request(self):
+        result = WSGIRequestHandler.parse_request(self)
+        # Whether the client has asked for the connection to be closed
+        self.client_close = self.close_connection
+        return result
+
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'transfer-encoding' and value.lower() == 'chunked':
+            self.chunked = True
+        elif keyword.lower() == 'connection' and value.lower() == 'close' and self.chunked:
+            # Werkzeug closes connections for responses without a ``Content-Length``
+            # but chunked responses are framed so the connection can be kept alive
+            return
+        WSGIRequestHandler.send_header(self, keyword, value)
+
+    def end_headers(self):
+        if self.chunked:
+            self.close_connection = self.client_close
+        if not self.close_connection and self.requests >= self.server.keep_alive_requests:
+            WSGIRequestHandler.send_header(self, 'Connection', 'close')
+        WSGIRequestHandler.end_headers(self)
+
+
+def chunked(chunks):
+    """
+    Encode chunks of a response body using chunked transfer encoding
+    """
+    for chunk in chunks:
+        if chunk:
+            yield ('%x\r\n' % len(chunk)).encode() + chunk + b'\r\n'
+    yield b'0\r\n\r\n'
+
+
 class JSONEncoder(json.JSONEncoder):
     """
     Custom JSON encoder for Python object
+
+    Dictionaries (including ``OrderedDict``s), lists and primitives, which are what
+    ``pack()`` produces, are encoded without calling ``default()`` (by ``json``'s C encoder
+    when encoding in one go with ``encode()``). For other objects the conversion to use is
+    determined once per type and cached. Bytes are encoded as base64 strings.
     """
 
+    # Conversion functions for types, keyed by type
+    converters = {}
+
     def default(self, object):
-        try:
-            iterable = iter(object)
-        except TypeError:
-            pass
-        else:
-            return list(iterable)
+        cls = object.__class__
+        converter = self.converters.get(cls)
+        if converter is None:
+            if issubclass(cls, (six.binary_type, bytearray)):
+                # e.g. buffers in tables packed in the `columnar` format
+                converter = convert_bytes
+            elif hasattr(cls, 'tolist'):
+                # e.g. numpy arrays and scalars
+                converter = convert_tolist
+            elif hasattr(cls, '__iter__'):
+                converter = convert_iterable
+            else:
+                converter = convert_properties
+            self.converters[cls] = converter
+
+        value = converter(object)
+        if value is undefined:
+            return json.JSONEncoder.default(self, object)
+        return value
+
+
+undefined = object()
+
+
+def convert_bytes(object):
+    return base64.b64encode(object).decode()
+
+
+def convert_tolist(object):
+    return object.tolist()
 
-        try:
-            properties = object.__dict__
-        except AttributeError:
-            pass
-        else:
-            return dict((key, value) for key, value in properties.items() if not key.startswith('_'))
 
-        return JSONEncoder.default(self, object)
+def convert_iterable(object):
+    return list(object)
+
+
+def convert_properties(object):
+    try:
+        properties = object.__dict__
+    except AttributeError:
+        return undefined
+    else:
+        return dict((key, value) for key, value in properties.items() if not key.startswith('_'))
+
+
+# A shared encoder. Values are trees, so checking for circular
+# references is unnecessary.
+encoder = JSONEncoder(check_circular=False)
 
 
 def to_json(object):
-    return JSONEncoder().encode(object)
+    """
+    Convert an object to a JSON string
+    """
+    return encoder.encode(object)
+
+
+def iter_json(object, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Convert an object to JSON as chunks of bytes
+
+    Avoids materialising the entire JSON string for large objects. Rather than using
+    ``iterencode()``, which is pure Python and several times slower, values with long lists
+    (e.g. the columns of a table) are encoded in pieces, each by ``json``'s C encoder,
+    and other values are encoded in one go.
+
+    :param chunk_size: Approximate number of characters in each chunk
+    :returns: A generator of ``bytes``
+    """
+    if not json_large(object):
+        yield encoder.encode(object).encode('utf-8')
+        return
+
+    buffer = []
+    size = 0
+    for piece in json_pieces(object):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def json_pieces(object):
+    """
+    Convert an object to JSON as a generator of strings
+
+    Lists longer than ``JSON_SLICE_SIZE`` are encoded ``JSON_SLICE_SIZE`` items at a time.
+    """
+    if not json_large(object):
+        yield encoder.encode(object)
+    elif isinstance(object, dict):
+        if not all(isinstance(key, six.string_types) for key in object):
+            # Other keys are converted to strings by the encoder
+            yield encoder.encode(object)
+            return
+        yield '{'
+        for index, (key, value) in enumerate(object.items()):
+            yield (', ' if index else '') + encoder.encode(key) + ': '
+            for piece in json_pieces(value):
+                yield piece
+        yield '}'
+    else:
+        yield '['
+        if len(object) > JSON_SLICE_SIZE:
+            for start in range(0, len(object), JSON_SLICE_SIZE):
+                yield (', ' if start else '') + encoder.encode(object[start:start + JSON_SLICE_SIZE])[1:-1]
+        else:
+            for index, item in enumerate(object):
+                if index:
+                    yield ', '
+                for piece in json_pieces(item):
+                    yield piece
+        yield ']'
+
+
+def json_large(object):
+    """
+    Does an object contain a list longer than ``JSON_SLICE_SIZE``?
+    """
+    if isinstance(object, dict):
+        for value in object.values():
+            if isinstance(value, (dict, list)) and json_large(value):
+                return True
+        return False
+    if isinstance(object, list):
+        if len(object) > JSON_SLICE_SIZE:
+            return True
+        for item in object:
+            if isinstance(item, (dict, list)) and json_large(item):
+                return True
+    return False
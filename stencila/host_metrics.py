@@ -0,0 +1,176 @@
+"""
+Metrics for a Host, exported in the Prometheus text format
+"""
+
+import bisect
+
+# Upper bounds of buckets for durations (in seconds)
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+# Upper bounds of buckets for sizes (in bytes)
+SIZE_BUCKETS = tuple(256 * 4 ** power for power in range(10))
+
+
+class Counter(object):
+    """
+    A counter for each combination of label values
+
+    Increments are not protected by a lock: they are cheap, and although concurrent
+    increments of the same series could, in rare cases, lose a count this is
+    acceptable for monitoring.
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, values=(), amount=1):
+        """
+        Increment the counter for a set of label values
+        """
+        try:
+            self.values[values] += amount
+        except KeyError:
+            self.values.setdefault(values, 0)
+            self.values[values] += amount
+
+    def samples(self):
+        for values, count in list(self.values.items()):
+            yield self.name, label(self.labels, values), count
+
+
+class Gauge(object):
+    """
+    A gauge whose values are obtained, when rendered, from a function
+
+    The function should return a dictionary of label values and gauge values.
+    """
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels, function):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = function
+
+    def samples(self):
+        for values, value in self.function().items():
+            yield self.name, label(self.labels, values), value
+
+
+class Histogram(object):
+    """
+    A histogram for each combination of label values
+
+    Bucket counts for each series are preallocated so that an observation only involves
+    a binary search for the bucket and two increments. As for ``Counter``, these
+    are not protected by a lock.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, values=()):
+        """
+        Observe a value for a set of label values
+        """
+        series = self.values.get(values)
+        if series is None:
+            series = self.values.setdefault(values, [[0] * (len(self.buckets) + 1), 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for values, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield self.name + '_bucket', label(self.labels + ('le',), values + (bound,)), cumulative
+            yield self.name + '_sum', label(self.labels, values), total
+            yield self.name + '_count', label(self.labels, values), cumulative
+
+
+def label(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+
+
+class HostMetrics(object):
+    """
+    Metrics for a Host
+
+    Records the number and duration of requests by server route and status, the duration of
+    instance method calls (e.g. ``execute``, ``compile``) and the size of their results by instance
+    type and method, and the number of live instances by type.
+    """
+
+    def __init__(self, host):
+        self.requests = Counter(
+            'stencila_requests_total', 'Number of requests handled', ('route', 'status')
+        )
+        self.request_durations = Histogram(
+            'stencila_request_duration_seconds', 'Duration of requests', ('route',)
+        )
+        self.call_durations = Histogram(
+            'stencila_call_duration_seconds', 'Duration of successful instance method calls', ('type', 'method')
+        )
+        self.call_sizes = Histogram(
+            'stencila_call_result_bytes', 'Size of the encoded results of instance method calls',
+            ('type', 'method'), SIZE_BUCKETS
+        )
+        self.instances = Gauge(
+            'stencila_instances', 'Number of live instances', ('type',), host.instance_counts
+        )
+        self.metrics = [
+            self.requests, self.request_durations, self.call_durations, self.call_sizes, self.instances
+        ]
+
+    def request(self, route, status, duration):
+        """
+        Record a request
+        """
+        self.requests.inc((route, status))
+        self.request_durations.observe(duration, (route,))
+
+    def call(self, type, method, duration):
+        """
+        Record an instance method call
+        """
+        self.call_durations.observe(duration, (type, method))
+
+    def call_size(self, type, method, size):
+        """
+        Record the size of the result of an instance method call
+        """
+        self.call_sizes.observe(size, (type, method))
+
+    def render(self):
+        """
+        Render metrics in the Prometheus text format
+
+        :returns: A string
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append('%s%s %s' % (name, labels, repr(value) if isinstance(value, float) else value))
+        return '\n'.join(lines) + '\n'
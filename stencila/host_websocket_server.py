@@ -0,0 +1,239 @@
+"""
+A Websocket server for a Host (Python 3 only)
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import struct
+
+from werkzeug.http import parse_cookie
+from werkzeug.urls import url_decode
+
+from . import binary
+from .host_asyncio_server import HostAsyncioServer
+from .host_http_server import to_json
+
+# GUID used to compute the `Sec-WebSocket-Accept` handshake header (RFC 6455)
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Websocket frame opcodes
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+class HostWebsocketServer(HostAsyncioServer):
+    """
+    A Websocket server for a Host
+
+    Provides access to a ``Host`` over persistent Websocket connections. Clients
+    are authorized once, when the connection is opened, using either a
+    ``Authorization: Bearer`` header or a ``token`` query parameter (since browsers
+    are unable to set headers on Websocket requests), or a ``session`` cookie
+    issued by the host's HTTP server.
+
+    Each message is a JSON request with an ``id``, a ``method`` (one of the
+    host methods available via ``HostHttpServer.route`` i.e. ``manifest``, ``create``,
+    ``get``, ``call``, ``delete`` or ``batch``) and a list of ``params``. Requests are handled
+    concurrently and each response carries the ``id`` of its request so that
+    clients can multiplex many requests over the one connection e.g.
+
+    .. code-block:: javascript
+
+        > {"id": 1, "method": "create", "params": ["PythonContext"]}
+        < {"id": 1, "result": "pythonContext1"}
+        > {"id": 2, "method": "call", "params": ["pythonContext1", "execute", {"code": "6*7"}]}
+        < {"id": 2, "result": {"code": "6*7", "outputs": [...], ...}}
+        > {"id": 3, "method": "call", "params": ["foo", "bar"]}
+        < {"id": 3, "error": {"message": "Unknown instance: foo"}}
+    """
+
+    # Host methods that can be requested
+    METHODS = ('manifest', 'create', 'get', 'call', 'delete', 'batch')
+
+    def __init__(self, host, address='127.0.0.1', port=2001, workers=None):
+        HostAsyncioServer.__init__(self, host, address, port, workers)
+
+    @property
+    def url(self):
+        """
+        Get the URL of the server
+
+        :returns: A URL string
+        """
+        return 'ws://%s:%s' % (self._address, self._port) if self._server else None
+
+    async def _connection(self, reader, writer):
+        """
+        Handle a connection: perform the opening handshake and then
+        handle messages until the connection is closed
+        """
+        try:
+            environ = await self._read(reader, writer)
+            if environ is None:
+                return
+            if not self._handshake(environ, writer):
+                await writer.drain()
+                return
+
+            tasks = set()
+            while True:
+                opcode, payload = await self._receive(reader)
+                if opcode == CLOSE:
+                    self._send(writer, CLOSE, payload[:2])
+                    break
+                elif opcode == PING:
+                    self._send(writer, PONG, payload)
+                elif opcode in (TEXT, BINARY):
+                    task = asyncio.ensure_future(self._message(opcode, payload, writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _handshake(self, environ, writer):
+        """
+        Authorize the connection and respond to the opening handshake
+
+        :returns: Whether or not the connection was upgraded
+        """
+        key = environ.get('HTTP_SEC_WEBSOCKET_KEY')
+        if environ.get('HTTP_UPGRADE', '').lower() != 'websocket' or not key:
+            return self._reject(writer, '400 Bad Request')
+
+        if self._host.key:
+            token = url_decode(environ.get('QUERY_STRING', '')).get('token')
+            match = re.match(r'^Bearer (.+)', environ.get('HTTP_AUTHORIZATION', ''))
+            if match:
+                token = match.group(1)
+            session = parse_cookie(environ.get('HTTP_COOKIE', '')).get('session')
+            if token:
+                try:
+                    self._host.authorize_token(token)
+                except Exception:
+                    return self._reject(writer, '403 Forbidden')
+            elif session:
+                # Browsers do not apply CORS to websockets, and send cookies with
+                # connections opened by any site, so check the origin
+                origin = environ.get('HTTP_ORIGIN')
+                if origin and not self.allowed_origin(origin):
+                    return self._reject(writer, '403 Forbidden')
+                try:
+                    self._host.authorize_session(session)
+                except Exception:
+                    return self._reject(writer, '403 Forbidden')
+            else:
+                return self._reject(writer, '401 Unauthorized')
+
+        accept = base64.b64encode(hashlib.sha1((key + GUID).encode()).digest()).decode()
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: %s\r\n\r\n' % accept
+        ).encode())
+        return True
+
+    def _reject(self, writer, status):
+        writer.write(('HTTP/1.1 %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n' % status).encode())
+        return False
+
+    async def _receive(self, reader):
+        """
+        Receive a message, reassembling it from fragmented frames if necessary
+
+        :returns: A tuple of the message opcode and payload
+        """
+        message = None
+        message_opcode = None
+        while True:
+            head = await reader.readexactly(2)
+            fin = head[0] & 0x80
+            opcode = head[0] & 0x0F
+            masked = head[1] & 0x80
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', await reader.readexactly(8))[0]
+            mask = await reader.readexactly(4) if masked else None
+            payload = await reader.readexactly(length)
+            if mask:
+                payload = unmask(payload, mask)
+
+            if opcode >= CLOSE:
+                # Control frames may be interleaved with fragments of a message
+                return opcode, payload
+            if opcode != CONTINUATION:
+                message_opcode = opcode
+                message = payload
+            else:
+                message += payload
+            if fin:
+                return message_opcode, message
+
+    def _send(self, writer, opcode, payload):
+        """
+        Send a (single frame, unmasked) message
+        """
+        length = len(payload)
+        if length < 126:
+            head = struct.pack('!BB', 0x80 | opcode, length)
+        elif length < 65536:
+            head = struct.pack('!BBH', 0x80 | opcode, 126, length)
+        else:
+            head = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+        writer.write(head + payload)
+
+    async def _message(self, opcode, payload, writer):
+        """
+        Handle a request message and send a response message
+
+        Text messages are JSON and binary messages use the ``binary`` module's
+        encoding. Responses are sent in the same format as their request.
+        """
+        id = None
+        if opcode == BINARY:
+            encode = binary.encode
+        else:
+            encode = lambda value: to_json(value).encode()
+        try:
+            if opcode == BINARY:
+                request = binary.decode(payload)
+            else:
+                request = json.loads(payload.decode())
+            id = request.get('id')
+            method = request.get('method')
+            params = request.get('params', [])
+            if method not in self.METHODS:
+                raise Exception('Unknown method: %s' % method)
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(self._executor, lambda: getattr(self._host, method)(*params))
+            response = encode({'id': id, 'result': result})
+        except Exception as exc:
+            response = encode({'id': id, 'error': {'message': str(exc)}})
+        self._send(writer, opcode, response)
+        await writer.drain()
+
+
+def unmask(payload, mask):
+    """
+    Unmask a frame payload sent by a client
+
+    Does the XOR of payload and mask using big integers rather than
+    byte by byte, which is much faster for large payloads.
+    """
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(length, 'little')
@@ -0,0 +1,283 @@
+"""
+A load generator for a host
+
+Spawns a host in a separate process (using ``python -m stencila spawn``) and drives a number of
+concurrent simulated sessions against it, each making a random mix of requests to create instances,
+execute cells in them, fetch them, and delete them. Reports throughput, latency percentiles and
+error rates e.g.
+
+    python -m stencila loadtest '{"sessions": 8, "duration": 30}'
+
+prints a table of these statistics. Add the ``--json`` flag to print the full report as JSON instead
+of the table.
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import timeit
+
+from six.moves import http_client
+from six.moves.urllib.parse import urlparse
+
+from .host import Host
+
+# Default relative frequencies of operations
+MIX = {
+    'create': 1,
+    'execute': 8,
+    'fetch': 2,
+    'delete': 1
+}
+
+# Percentiles of latency reported
+PERCENTILES = (50, 95, 99)
+
+
+class Session(object):
+    """
+    A simulated client session
+
+    Uses a single persistent connection to the host. The session is authorized
+    with a request token and then uses the session cookie issued by the host.
+    """
+
+    def __init__(self, url, token, mix, type, code, seed):
+        self._url = urlparse(url)
+        self._token = token
+        self._cookie = None
+        self._connection = None
+        self._operations = sorted(mix.keys())
+        self._weights = [mix[operation] for operation in self._operations]
+        self._type = type
+        self._code = json.dumps({'code': code})
+        self._random = random.Random(seed)
+        self._instances = []
+        # List of (operation, seconds, ok) tuples
+        self.results = []
+
+    def request(self, method, path, body=None):
+        """
+        Make a request
+
+        :returns: A tuple of the response status and body
+        """
+        headers = {}
+        if self._cookie:
+            headers['Cookie'] = self._cookie
+        else:
+            headers['Authorization'] = 'Bearer ' + self._token
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        try:
+            if not self._connection:
+                self._connection = http_client.HTTPConnection(self._url.hostname, self._url.port)
+            self._connection.request(method, path, body, headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except Exception:
+            # Reconnect on the next request
+            self.close()
+            raise
+        if not self._cookie and response.getheader('Set-Cookie'):
+            self._cookie = response.getheader('Set-Cookie').split(';')[0]
+        return response.status, data
+
+    def operation(self):
+        """
+        Make a randomly chosen request
+
+        Operations which need an instance create one if the session has none.
+        """
+        operation = self.choose()
+        if operation != 'create' and not self._instances:
+            operation = 'create'
+
+        start = timeit.default_timer()
+        ok = False
+        try:
+            if operation == 'create':
+                status, data = self.request('POST', '/' + self._type)
+                ok = status == 200
+                if ok:
+                    self._instances.append(json.loads(data.decode()))
+            else:
+                instance = self._random.choice(self._instances)
+                if operation == 'execute':
+                    status, data = self.request('PUT', '/%s!execute' % instance, self._code)
+                    ok = status == 200 and not json.loads(data.decode()).get('messages')
+                elif operation == 'fetch':
+                    status, data = self.request('GET', '/' + instance)
+                    ok = status == 200
+                elif operation == 'delete':
+                    status, data = self.request('DELETE', '/' + instance)
+                    ok = status == 200
+                    self._instances.remove(instance)
+                else:
+                    raise ValueError('Unknown operation: %s' % operation)
+        except (IOError, OSError, http_client.HTTPException):
+            pass
+        self.results.append((operation, timeit.default_timer() - start, ok))
+
+    def choose(self):
+        """
+        Choose an operation, weighted by it's frequency in the mix
+        """
+        point = self._random.uniform(0, sum(self._weights))
+        for operation, weight in zip(self._operations, self._weights):
+            point -= weight
+            if point <= 0:
+                return operation
+        return self._operations[-1]
+
+    def run(self, until=None, requests=None):
+        """
+        Make requests until a time, or for a number of requests
+        """
+        while (until is None or timeit.default_timer() < until) and (requests is None or len(self.results) < requests):
+            self.operation()
+        # Clean up any remaining instances
+        for instance in self._instances:
+            try:
+                self.request('DELETE', '/' + instance)
+            except (IOError, OSError, http_client.HTTPException):
+                pass
+        self.close()
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100.0), len(values) - 1)]
+
+
+def summarize(results, elapsed):
+    """
+    Summarize the results of operations
+
+    :param results: A list of (operation, seconds, ok) tuples
+    :param elapsed: Number of seconds over which the operations were made
+    :returns: A dictionary of statistics
+    """
+    durations = [duration * 1000 for operation, duration, ok in results]
+    errors = len([ok for operation, duration, ok in results if not ok])
+    summary = {
+        'requests': len(results),
+        'errors': errors,
+        'error_rate': float(errors) / len(results) if results else 0,
+        'throughput': len(results) / elapsed if elapsed else 0
+    }
+    for percent in PERCENTILES:
+        summary['p%s' % percent] = percentile(durations, percent) if durations else None
+    return summary
+
+
+def spawn(options):
+    """
+    Spawn a host in a separate process
+
+    :param options: Options passed to ``Host.spawn()``
+    :returns: A tuple of the process and the host details it outputs
+    """
+    # Ensure that the host uses the same version of this package
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [path] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])
+    ))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'stencila', 'spawn', json.dumps(options)],
+        stdout=subprocess.PIPE, env=env
+    )
+    output = ''
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            process.wait()
+            raise RuntimeError('Host exited before starting: %s' % output)
+        output += line.decode()
+        try:
+            return process, json.loads(output)
+        except ValueError:
+            pass
+
+
+def loadtest(sessions=4, duration=10, requests=None, mix=None, type='PythonContext', code='6 * 7',
+             options=None, seed=None, quiet=False):
+    """
+    Run a load test against a spawned host
+
+    :param sessions: Number of concurrent sessions
+    :param duration: Number of seconds to run for
+    :param requests: Number of requests for each session to make (instead of running for ``duration``)
+    :param mix: Relative frequencies of each operation (``create``, ``execute``, ``fetch`` and
+                ``delete``) e.g. ``{"execute": 10, "create": 1, "delete": 1}``. Defaults to ``MIX``.
+    :param type: Type of instances to create
+    :param code: Code of the cell to execute
+    :param options: Options for spawning the host (see ``Host.start()``).
+                    Defaults to ``{"threaded": true}`` so that requests are served concurrently.
+    :param seed: Seed for the random choice of operations
+    :param quiet: Do not print a summary
+    :returns: A dictionary of statistics, in ``total`` and for each operation in ``operations``
+    """
+    mix = mix or MIX
+    for operation in mix:
+        if operation not in MIX:
+            raise ValueError('Unknown operation: %s' % operation)
+    options = dict({'threaded': True}, **(options or {}))
+
+    process, details = spawn(options)
+    try:
+        url = details['manifest']['servers']['http']['url']
+        # Tokens are signed with the spawned host's key
+        host = Host()
+        runs = [
+            Session(
+                url, host.generate_token(details['id']), mix, type, code,
+                None if seed is None else seed + index
+            ) for index in range(sessions)
+        ]
+
+        start = timeit.default_timer()
+        until = None if requests else start + duration
+        threads = [
+            threading.Thread(target=session.run, args=(until, requests)) for session in runs
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = timeit.default_timer() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    results = [result for session in runs for result in session.results]
+    report = {
+        'sessions': sessions,
+        'duration': elapsed,
+        'total': summarize(results, elapsed),
+        'operations': dict(
+            (operation, summarize([result for result in results if result[0] == operation], elapsed))
+            for operation in sorted(set(result[0] for result in results))
+        )
+    }
+
+    if not quiet:
+        print('%-10s %10s %10s %10s %12s %10s %10s %10s' % (
+            'operation', 'requests', 'errors', 'error %', 'per second', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)'
+        ))
+        for name, summary in sorted(report['operations'].items()) + [('total', report['total'])]:
+            print('%-10s %10d %10d %10.2f %12.1f %10.2f %10.2f %10.2f' % (
+                name, summary['requests'], summary['errors'], summary['error_rate'] * 100,
+                summary['throughput'], summary['p50'], summary['p95'], summary['p99']
+            ))
+        sys.stdout.flush()
+
+    return report
@@ -0,0 +1,23 @@
+"""
+A matplotlib backend used by `PythonContext`
+
+The same as the non-interactive 'Agg' backend except that, when a cell is being
+executed with an ``emit`` function, ``show()`` emits the current figure as a
+``figure`` event (and then clears it) so that clients can display plots as they
+are made.
+"""
+
+# pylint: disable=wildcard-import,unused-wildcard-import
+
+from matplotlib.backends.backend_agg import *  # noqa: F401,F403
+
+from .python_context import emitter
+from .value import pack
+
+
+def show(*args, **kwargs):
+    emit = emitter()
+    if emit:
+        import matplotlib.pyplot
+        emit('figure', pack(matplotlib.pyplot.gcf()))
+        matplotlib.pyplot.clf()
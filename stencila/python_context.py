@@ -1,20 +1,18 @@
 import ast
+import collections
+import ctypes
 import io
 import os
 import six
 import sys
+import threading
+import timeit
 import traceback
+import types
 
 from .value import pack, unpack
 from .value import type as type_
 
-import numpy
-import pandas
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt  # pylint: disable=import-error
-
 from .context import Context
 
 undefined = object()
@@ -27,16 +25,205 @@ undefined = object()
 from six.moves import builtins
 GLOBALS = dir(builtins)
 
+# Default maximum number of rows in a table output, above
+# which a pointer to the table is output instead
+MAX_ROWS = 1000
+
+# Operators for filters in `fetch()`
+FILTERS = {
+    '==': lambda column, value: column == value,
+    '!=': lambda column, value: column != value,
+    '<': lambda column, value: column < value,
+    '<=': lambda column, value: column <= value,
+    '>': lambda column, value: column > value,
+    '>=': lambda column, value: column >= value,
+    'in': lambda column, value: column.isin(value),
+    'contains': lambda column, value: column.astype(str).str.contains(value, regex=False)
+}
+
+
+# The function used to emit events, if any, for the cell being executed by each thread
+emitters = threading.local()
+
+
+def emitter():
+    """
+    Get the function used to emit events for the cell being executed
+    by the current thread
+
+    :returns: A function (or ``None``)
+    """
+    return getattr(emitters, 'emit', None)
+
+
+class OutputStream(object):
+    """
+    A replacement for ``sys.stdout`` or ``sys.stderr`` which emits what is written,
+    by a thread executing a cell that is emitting events, as ``stdout`` or ``stderr`` events
+
+    Writes by all other threads are passed through to the original stream.
+    """
+
+    def __init__(self, name, stream):
+        self._name = name
+        self._stream = stream
+
+    def write(self, text):
+        emit = emitter()
+        if emit:
+            emit(self._name, {'text': text})
+        else:
+            self._stream.write(text)
+
+    def __getattr__(self, attr):
+        return getattr(self._stream, attr)
+
+
+# The non-interactive backend used for plots (based on 'Agg', see `matplotlib_backend`)
+MATPLOTLIB_BACKEND = 'module://stencila.matplotlib_backend'
+
+
+def use_matplotlib_backend():
+    """
+    Use ``MATPLOTLIB_BACKEND`` for plots
+
+    To avoid the cost of importing ``matplotlib`` unless it is used, if it has not yet been
+    imported, an import hook selects the backend when it is. (Setting the ``MPLBACKEND``
+    environment variable instead would also affect other processes started from this one,
+    which may not be able to import the backend.)
+    """
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use(MATPLOTLIB_BACKEND)
+    elif not any(isinstance(finder, MatplotlibImportHook) for finder in sys.meta_path):
+        sys.meta_path.insert(0, MatplotlibImportHook())
+
+
+class MatplotlibImportHook(object):
+    """
+    An import hook which selects ``MATPLOTLIB_BACKEND`` when ``matplotlib`` is imported
+    """
+
+    def __init__(self):
+        self._importing = False
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != 'matplotlib':
+            return None
+        import importlib.machinery
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec and spec.loader and hasattr(spec.loader, 'exec_module'):
+            spec.loader = MatplotlibLoader(spec.loader)
+        return spec
+
+    # For Python 2, which does not use `find_spec()`
+
+    def find_module(self, fullname, path=None):
+        return self if fullname == 'matplotlib' and not self._importing else None
+
+    def load_module(self, fullname):
+        import importlib
+        self._importing = True
+        try:
+            module = importlib.import_module(fullname)
+        finally:
+            self._importing = False
+        module.use(MATPLOTLIB_BACKEND)
+        return module
+
+
+class MatplotlibLoader(object):
+    """
+    Wraps the loader of ``matplotlib`` to select ``MATPLOTLIB_BACKEND`` once it is loaded
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # So that the module's loader is the original
+        module.__loader__ = module.__spec__.loader = self._loader
+        self._loader.exec_module(module)
+        module.use(MATPLOTLIB_BACKEND)
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class CellInterrupted(BaseException):
+    """
+    Raised in the thread executing a cell to interrupt it
+
+    Derived from ``BaseException`` so that it is not caught by
+    ``except Exception`` clauses in the cell's code.
+    """
+    pass
+
 
 class PythonContext(Context):
+    """
+    A context for executing Python code
+
+    Execution of a cell can be interrupted, after it has run for longer than
+    a ``timeout`` (in seconds; a ``timeout`` option for the cell, or otherwise
+    for the context), or by calling ``cancel()``. The interruption is reported as an
+    error message in the cell, and the context remains usable.
+
+    A table output by a cell is packed in the ``json`` format unless the cell has a
+    ``format`` option (e.g. ``columnar``, see ``pack_columnar()``). If the table has more than
+    ``max_rows`` rows (a ``max_rows`` option for the cell, or otherwise for the context) a pointer
+    to the table is output instead and clients can page through it using ``fetch()``.
+    """
+
+    # Maximum number of tables, output by cells but not assigned
+    # to a variable, that are kept so that they can be fetched
+    OUTPUTS_SIZE = 10
 
     def __init__(self, *args, **kwargs):
+        self._timeout = kwargs.pop('timeout', None)
+        self._max_rows = kwargs.pop('max_rows', MAX_ROWS)
         Context.__init__(self, *args, **kwargs)
 
+        # Identifier of the thread currently executing a cell, the reason
+        # it is being interrupted, and a lock to protect both
+        self._executing = None
+        self._interrupted = None
+        self._interrupt_lock = threading.Lock()
+
         if self._dir:
             os.chdir(self._dir)
 
+        use_matplotlib_backend()
+
         self._variables = {}
+        self._outputs = collections.OrderedDict()
+        self._output_count = 0
+
+    def memory(self, *args):
+        """
+        Estimate the memory used by this context's variables
+
+        Uses the shallow size of tables and arrays (which is fast to calculate
+        but does not include the size of any Python objects they hold).
+
+        :returns: A number of bytes
+        """
+        pandas = sys.modules.get('pandas')
+        numpy = sys.modules.get('numpy')
+        size = 0
+        for value in list(self._variables.values()) + list(self._outputs.values()):
+            if isinstance(value, types.ModuleType):
+                # Modules are shared so are not counted
+                continue
+            elif pandas and isinstance(value, pandas.DataFrame):
+                size += int(value.memory_usage(index=True).sum())
+            elif numpy and isinstance(value, numpy.ndarray):
+                size += int(value.nbytes)
+            else:
+                size += sys.getsizeof(value)
+        return size
 
     def libraries(self, *args):
         return []
@@ -128,9 +315,29 @@ class PythonContext(Context):
 
         return cell
 
-    def execute(self, cell):
-        cell = self.compile(cell)
+    def execute(self, cell, emit=None):
+        """
+        Execute a cell
 
+        :param emit: A function, called with the name and data of events, for
+                     progress events while the cell is executing: ``start``,
+                     ``stdout`` and ``stderr`` (output text), ``figure`` (a plot,
+                     when ``show()`` is called) and ``end`` (with the ``duration``)
+        :returns: The executed ``cell``
+        """
+        cell = self.compile(cell)
+        if emit:
+            start = timeit.default_timer()
+            emit('start', {})
+            try:
+                return self._execute(cell, emit)
+            finally:
+                emit('end', {'duration': timeit.default_timer() - start})
+        return self._execute(cell)
+    # Allow the host to pass an `emit` function
+    execute.streams = True
+
+    def _execute(self, cell, emit=None):
         try:
             inputs = {}
             for input in cell['inputs']:
@@ -151,14 +358,35 @@ class PythonContext(Context):
                         if value_id != variable_id:
                             del self._variables[name]
                             inputs[name] = unpack(value)
+                elif value.get('context') == self._name and 'data' not in value:
+                    # A pointer to a table in this context
+                    inputs[name] = self._dereference(value['name'])
                 else:
                     inputs[name] = unpack(value)
 
             code = cell['code'].strip()
+            timeout = cell['options'].get('timeout', self._timeout)
             try:
-                six.exec_(code, inputs, self._variables)
+                try:
+                    self._begin(timeout, emit)
+                    six.exec_(code, inputs, self._variables)
+                finally:
+                    self._end()
             except RuntimeError as exc:
                 cell['messages'].append(self._runtime_error(exc))
+            except (CellInterrupted, KeyboardInterrupt):
+                reason = self._interrupted or 'cancelled'
+                self._interrupted = None
+                self._executing = None
+                cell['messages'].append({
+                    'type': 'error',
+                    'message': (
+                        'Execution timed out after %s seconds' % timeout if reason == 'timeout'
+                        else 'Execution was cancelled'
+                    ),
+                    'interrupted': reason
+                })
+                return cell
 
             # Evaluate the last line and if no error then make the value output
             # This is inefficient in the sense that the last line is evaluated twice
@@ -176,7 +404,14 @@ class PythonContext(Context):
                     output = self._variables.get(name)
 
             if output is not undefined:
-                packed = pack(output)
+                max_rows = cell['options'].get('max_rows', self._max_rows)
+                if max_rows is not None and type_(output) == 'table' and len(output) > max_rows:
+                    name = cell['outputs'][0].get('name') if len(cell['outputs']) else None
+                    if not name or self._variables.get(name) is not output:
+                        name = self._hold(output)
+                    packed = self._pointer(name, output)
+                else:
+                    packed = pack(output, cell['options'].get('format', 'json'))
                 if len(cell['outputs']):
                     cell['outputs'][0]['value'] = packed
                 else:
@@ -186,7 +421,8 @@ class PythonContext(Context):
 
             # Clear the current matplotlib figure (if any)
             # after any plot has been packed as an output
-            plt.clf()
+            if 'matplotlib.pyplot' in sys.modules:
+                sys.modules['matplotlib.pyplot'].clf()
 
         except Exception as exc:
             cell['messages'].append({
@@ -197,6 +433,169 @@ class PythonContext(Context):
 
         return cell
 
+    def fetch(self, name, options=None):
+        """
+        Fetch the value of a variable (e.g. a table pointed to by a cell output)
+
+        For tables, ``options`` can be used to select the rows and columns to fetch:
+
+        - ``filter``: a list of ``[column, operator, value]`` conditions, all of which rows
+          must meet, where ``operator`` is one of ``==``, ``!=``, ``<``, ``<=``, ``>``, ``>=``,
+          ``in`` or ``contains``
+        - ``sort``: a column name, or list of them, to sort rows by (descending if the
+          name is prefixed with ``-``)
+        - ``offset`` and ``limit``: the range of rows, after filtering and sorting,
+          to fetch (``limit`` defaults to ``max_rows``)
+        - ``columns``: a list of the names of the columns to fetch
+        - ``format``: the format to pack the rows in, ``json`` or ``columnar``
+
+        :param name: Name of the variable, or a dictionary with the ``name`` and any options
+                     (e.g. when called via a host)
+        :returns: A value package. For tables, it also has the number of ``rows`` after
+                  filtering, and the ``offset`` of the first row fetched.
+        """
+        if isinstance(name, dict):
+            options = dict(name)
+            name = options.pop('name')
+        options = options or {}
+
+        value = self._dereference(name)
+        if type_(value) != 'table':
+            return pack(value)
+
+        for column, operator, operand in options.get('filter', []):
+            if column not in value.columns:
+                raise RuntimeError('Unknown column: %s' % column)
+            if operator not in FILTERS:
+                raise RuntimeError('Unknown filter operator: %s' % operator)
+            value = value[FILTERS[operator](value[column], operand)]
+
+        sort = options.get('sort')
+        if sort:
+            if not isinstance(sort, list):
+                sort = [sort]
+            by = [column.lstrip('-') for column in sort]
+            for column in by:
+                if column not in value.columns:
+                    raise RuntimeError('Unknown column: %s' % column)
+            value = value.sort_values(by, ascending=[not column.startswith('-') for column in sort])
+
+        rows = len(value)
+        offset = int(options.get('offset', 0))
+        limit = options.get('limit', self._max_rows)
+        value = value.iloc[offset:None if limit is None else offset + int(limit)]
+
+        columns = options.get('columns')
+        if columns:
+            for column in columns:
+                if column not in value.columns:
+                    raise RuntimeError('Unknown column: %s' % column)
+            value = value[columns]
+
+        packed = pack(value, options.get('format', 'json'))
+        packed['rows'] = rows
+        packed['offset'] = offset
+        return packed
+
+    def _hold(self, value):
+        """
+        Hold a value, output by a cell but not assigned to a variable,
+        so that it can be fetched
+
+        :returns: The name of the value
+        """
+        self._output_count += 1
+        name = 'output%d' % self._output_count
+        self._outputs[name] = value
+        while len(self._outputs) > self.OUTPUTS_SIZE:
+            self._outputs.popitem(last=False)
+        return name
+
+    def _dereference(self, name):
+        """
+        Get the value of a variable, or a held output, by name
+        """
+        if name in self._variables:
+            return self._variables[name]
+        if name in self._outputs:
+            return self._outputs[name]
+        raise RuntimeError('Unknown variable: %s' % name)
+
+    def _pointer(self, name, value):
+        """
+        Create a pointer to a table in this context
+        """
+        return {
+            'type': 'table',
+            'host': self._host.servers.get('http') if self._host else None,
+            'context': self._name,
+            'name': name,
+            'rows': len(value),
+            'columns': [str(column) for column in value.columns]
+        }
+
+    def cancel(self, *args):
+        """
+        Cancel the execution of the current cell (if any)
+
+        Can be called while a cell is executing (e.g. from another thread).
+        Over HTTP, this requires a host that serves requests concurrently (i.e. one started with
+        ``threaded``, ``asynchronous`` or ``websocket``); otherwise the request to cancel is not
+        handled until the execution has finished.
+
+        :returns: Whether or not there was an execution to cancel
+        """
+        return self._interrupt('cancelled')
+    # Allow the host to call this method while other methods are running
+    cancel.concurrent = True
+
+    def _begin(self, timeout, emit=None):
+        """
+        Record that the current thread is executing a cell, start a
+        timer to interrupt it after the timeout, and capture it's output
+        if it is emitting events
+        """
+        if emit:
+            for name in ('stdout', 'stderr'):
+                if not isinstance(getattr(sys, name), OutputStream):
+                    setattr(sys, name, OutputStream(name, getattr(sys, name)))
+            emitters.emit = emit
+        with self._interrupt_lock:
+            self._executing = threading.current_thread().ident
+            self._interrupted = None
+        if timeout:
+            self._timer = threading.Timer(float(timeout), self._interrupt, ('timeout',))
+            self._timer.daemon = True
+            self._timer.start()
+        else:
+            self._timer = None
+
+    def _end(self):
+        """
+        Record that the current thread has finished executing a cell
+        """
+        emitters.emit = None
+        with self._interrupt_lock:
+            self._executing = None
+        if self._timer:
+            self._timer.cancel()
+
+    def _interrupt(self, reason):
+        """
+        Interrupt the thread executing a cell by raising a ``CellInterrupted``
+        exception in it. The exception is raised when the thread next runs
+        Python code, so will not interrupt a blocking call (e.g. ``time.sleep``)
+        until it returns.
+        """
+        with self._interrupt_lock:
+            if self._executing is None:
+                return False
+            self._interrupted = reason
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                ctypes.c_ulong(self._executing), ctypes.py_object(CellInterrupted)
+            )
+            return True
+
     def _runtime_error(self):
         exc_type, exc_value, exc_traceback = sys.exc_info()
         # Extract traceback and for compatibility with >=Py3.5 ensure converted to tuple
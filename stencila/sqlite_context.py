@@ -3,8 +3,6 @@ import re
 import sqlite3
 import string
 
-import pandas
-
 from .value import pack, unpack
 from .context import Context
 
@@ -22,6 +20,16 @@ class SqliteContext(Context):
 
         self._connection = sqlite3.connect(db)
 
+    def memory(self, *args):
+        """
+        Get the size of this context's database
+
+        :returns: A number of bytes
+        """
+        page_count = self._connection.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self._connection.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
     def compile(self, operation):
         """
         Compile an operation
@@ -74,7 +82,7 @@ class SqliteContext(Context):
             if sql:
                 # If the "assign" SQL extension is used then transform the SQL
                 select = None
-                match = re.match('^\s*(\w+)\s*=\s*\b(SELECT\b.*)', sql)
+                match = re.match(r'^\s*(\w+)\s*=\s*\b(SELECT\b.*)', sql)
                 if match:
                     value = match.group(1)
                     select = match.group(2)
@@ -120,6 +128,7 @@ class SqliteContext(Context):
         """
         rows = self._connection.execute('SELECT count(*) FROM %s' % data).fetchone()[0]
         if rows <= max_rows:
+            import pandas
             data_frame = pandas.read_sql_query('SELECT * FROM %s' % data, self._connection)
             return pack(data_frame)
         else:
@@ -137,6 +146,7 @@ class SqliteContext(Context):
 
     def fetch(self, name, options={}):
         # TODO implement options e.g. pagination
+        import pandas
         data_frame = pandas.read_sql_query('SELECT * FROM %s' % name, self._connection)
         return pack(data_frame)
 
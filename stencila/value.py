@@ -12,13 +12,16 @@ from collections import OrderedDict
 import inspect
 import glob
 import re
-import sphinxcontrib.napoleon
-import sphinxcontrib.napoleon.docstring
-import matplotlib
-import numpy
-import pandas
+import sys
 import six
 
+from . import binary
+
+# Heavy dependencies (``numpy``, ``pandas``, ``matplotlib`` and ``sphinxcontrib.napoleon``)
+# are imported only when they are needed, so that importing this module (and the host) is fast.
+# A value can only be an instance of one of their types if the module has already been
+# imported (e.g. by code executed in a context) so ``type()`` checks ``sys.modules``.
+
 
 def type(value):
     """
@@ -28,6 +31,8 @@ def type(value):
     :returns: Type code for value
     """
     type_ = __builtins__['type'](value).__name__
+    artist = sys.modules.get('matplotlib.artist')
+    pandas = sys.modules.get('pandas')
 
     if value is None:
         return 'null'
@@ -39,9 +44,9 @@ def type(value):
         return 'number'
     elif type_ == 'str' or type_ == 'unicode':
         return 'string'
-    elif (
-        isinstance(value, (matplotlib.figure.Figure, matplotlib.artist.Artist)) or
-        (type_ == 'list' and len(value) == 1 and isinstance(value[0], matplotlib.artist.Artist))
+    elif artist and (
+        isinstance(value, artist.Artist) or
+        (type_ == 'list' and len(value) == 1 and isinstance(value[0], artist.Artist))
     ):
         # Use the special 'matplotlib' type to identify plot values that need
         # to be converted to the standard 'image' type during `pack()`
@@ -53,7 +58,7 @@ def type(value):
         if type_ and isinstance(type_, str):
             return type_
         return 'object'
-    elif isinstance(value, pandas.DataFrame):
+    elif pandas and isinstance(value, pandas.DataFrame):
         return 'table'
     elif type_ == 'module':
         return 'module'
@@ -63,11 +68,12 @@ def type(value):
         raise RuntimeError('Unhandled Python type: ' + type_)
 
 
-def pack(value):
+def pack(value, format='json'):
     """
     Pack an object into a value package
 
     :param value: A Python value
+    :param format: The format for tables, ``json`` or ``columnar`` (see ``pack_columnar()``)
     :returns: A value package
     """
     type_ = type(value)
@@ -87,43 +93,34 @@ def pack(value):
         return pack_function(value)
     elif type_ == 'module':
         return pack_module(value)
+    elif type_ == 'table' and format == 'columnar':
+        format_ = 'columnar'
+        data = pack_columnar(value)
     elif type_ == 'table':
-        # It is necessary to remove NANs before serialising
-        # as JSON. See https://stackoverflow.com/a/34467382
-        # for why we need to do this and why we used this approach
-        value = value.where(pandas.notnull(value), None)
+        import numpy
+        import pandas
 
+        # Each column is converted to a list of Python values in one step
+        # using `tolist()` (rather than converting each value). Nulls
+        # (e.g. `NaN`s, which can not be serialised as JSON) are replaced
+        # with `None`, only for columns that can, and do, have them.
         columns = OrderedDict()
-        for column in value.columns:
-            col = value[column]
-            # See the list of numpy data types at
-            # https://docs.scipy.org/doc/numpy/reference/arrays.scalars.html#arrays-scalars-built-in
-            values = list(col)
-            if col.dtype in (numpy.bool_, numpy.bool8):
-                column_type = 'boolean'
-                values = [bool(row) for row in values]
-            elif col.dtype in (numpy.int8, numpy.int16, numpy.int32, numpy.int64):
-                column_type = 'integer'
-                values = [int(row) for row in values]
-            elif col.dtype in (numpy.float16, numpy.float32, numpy.float64):
-                column_type = 'number'
-                values = [float(row) for row in values]
-            elif col.dtype in (numpy.str_, numpy.unicode_,):
-                column_type = 'string'
-            elif col.dtype == numpy.object and values:
-                # Get the type from the type of the first value
-                column_type = {
-                    str: 'string'
-                }.get(__builtins__['type'](values[0]))
-            else:
-                column_type = col.dtype.name
-            columns[column] = values
+        for name, column in value.items():
+            values = column.tolist()
+            if not (isinstance(column.dtype, numpy.dtype) and column.dtype.kind in 'biu'):
+                nulls = pandas.isnull(column).values
+                if nulls.any():
+                    for index in numpy.flatnonzero(nulls):
+                        values[index] = None
+            columns[name] = values
         data = OrderedDict([('type', 'table'), ('data', columns)])
     elif type_ == 'matplotlib':
+        import matplotlib.pyplot
+
         image = BytesIO()
         matplotlib.pyplot.savefig(image, format='png')
         type_ = 'image'
-        src = 'data:image/png;base64,' + base64.encodestring(image.getvalue()).decode()
+        src = 'data:image/png;base64,' + base64.b64encode(image.getvalue()).decode()
         return {'type': type_, 'src': src}
     else:
         raise RuntimeError('Unable to pack object\n  type: ' + type_)
@@ -131,6 +128,132 @@ def pack(value):
     return {'type': type_, 'format': format_, 'data': data}
 
 
+def pack_columnar(value):
+    """
+    Pack a data frame into the ``columnar`` table format
+
+    In this format each column is a dictionary with it's ``name`` and a ``data``
+    buffer (``bytes``, or when encoded as JSON, a base64 string):
+
+    - for boolean, integer, floating point and date-time columns, the column's
+      values as a little-endian array, with it's numpy ``dtype`` e.g. ``<f8``
+    - for string columns (``dtype`` ``string``), the UTF-8 encoded strings, one
+      after the other, with the ``offsets`` of each string's start (and of the end
+      of the last string) as a ``<i8`` array
+
+    A column which has nulls also has a validity bitmap, ``valid``, with a bit for each row
+    (most significant bit first), which is set if the value is not null. Columns of other types
+    (e.g. of mixed types) have a list of ``values``, as in the ``json`` format.
+
+    Because numeric columns are buffers, rather than lists of values, packing, encoding and
+    unpacking them is much faster, and uses much less memory, than for the ``json`` format,
+    in particular when using the binary encoding (see ``binary``).
+
+    :param value: A data frame
+    :returns: A dictionary with the number of ``rows`` and a list of ``columns``
+    """
+    import numpy
+    import pandas
+
+    columns = []
+    for name, column in value.items():
+        dtype = column.dtype
+        nulls = None
+        if not (isinstance(dtype, numpy.dtype) and dtype.kind in 'biu'):
+            nulls = pandas.isnull(column).values
+            if not nulls.any():
+                nulls = None
+
+        spec = OrderedDict([('name', name)])
+        if isinstance(dtype, numpy.dtype) and dtype.kind in 'biufM':
+            array = column.values
+        elif isinstance(dtype, pandas.api.extensions.ExtensionDtype) and dtype.kind in 'biuf' and \
+                hasattr(dtype, 'numpy_dtype'):
+            # A pandas nullable (masked) extension type e.g. `Int64`
+            spec['extension'] = dtype.name
+            array = column.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        else:
+            array = None
+        if array is not None:
+            array = numpy.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+            spec['dtype'] = array.dtype.str
+            spec['data'] = array.tobytes()
+        else:
+            values = column.tolist()
+            if nulls is not None:
+                for index in numpy.flatnonzero(nulls):
+                    values[index] = None
+            if all(isinstance(item, six.string_types) or item is None for item in values):
+                strings = [item.encode('utf-8') if item is not None else b'' for item in values]
+                offsets = numpy.zeros(len(strings) + 1, dtype='<i8')
+                numpy.cumsum(numpy.fromiter(map(len, strings), dtype='<i8', count=len(strings)), out=offsets[1:])
+                spec['dtype'] = 'string'
+                spec['offsets'] = offsets.tobytes()
+                spec['data'] = b''.join(strings)
+            else:
+                spec['values'] = values
+                nulls = None
+        if nulls is not None:
+            spec['valid'] = numpy.packbits(~nulls).tobytes()
+        columns.append(spec)
+
+    return OrderedDict([('type', 'table'), ('rows', len(value)), ('columns', columns)])
+
+
+def unpack_columnar(data):
+    """
+    Unpack a table in the ``columnar`` format (see ``pack_columnar()``) into a data frame
+
+    Numeric columns are read directly from their buffers, using ``numpy.frombuffer``.
+
+    :param data: A dictionary with the number of ``rows`` and a list of ``columns``
+    :returns: A data frame
+    """
+    import numpy
+    import pandas
+
+    def buffer(value):
+        # Buffers are base64 encoded when the package has been encoded as JSON
+        if isinstance(value, six.text_type):
+            return base64.b64decode(value)
+        return value
+
+    rows = data['rows']
+    columns = OrderedDict()
+    for spec in data['columns']:
+        valid = spec.get('valid')
+        if valid is not None:
+            valid = numpy.unpackbits(numpy.frombuffer(buffer(valid), dtype=numpy.uint8))[:rows].astype(bool)
+
+        dtype = spec.get('dtype')
+        if dtype is None:
+            column = spec['values']
+        elif dtype == 'string':
+            offsets = numpy.frombuffer(buffer(spec['offsets']), dtype='<i8').tolist()
+            strings = buffer(spec['data'])
+            column = numpy.empty(rows, dtype=object)
+            column[:] = [
+                strings[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])
+            ]
+            if valid is not None:
+                column[~valid] = None
+        else:
+            column = numpy.frombuffer(buffer(spec['data']), dtype=dtype)
+            if spec.get('extension'):
+                column = pandas.array(column, dtype=spec['extension'])
+                if valid is not None:
+                    column[~valid] = None
+            elif valid is not None:
+                if column.dtype.kind in 'fM':
+                    column = column.copy()
+                    column[~valid] = numpy.nan if column.dtype.kind == 'f' else numpy.datetime64('NaT')
+                else:
+                    column = numpy.where(valid, column, None)
+        columns[spec['name']] = column
+
+    return pandas.DataFrame(columns, index=pandas.RangeIndex(rows))
+
+
 def pack_function(func=None, file=None, dir=None):
     """
     Pack a function object
@@ -228,6 +351,9 @@ def pack_function(func=None, file=None, dir=None):
     docstring_params = {}
     docstring_returns = {}
     if docstring:
+        import sphinxcontrib.napoleon
+        import sphinxcontrib.napoleon.docstring
+
         docstring = trim_docstring(docstring)
         config = sphinxcontrib.napoleon.Config(napoleon_use_param=True, napoleon_use_rtype=True)
         docstring = sphinxcontrib.napoleon.docstring.NumpyDocstring(docstring, config, what='function').lines()
@@ -333,11 +459,13 @@ def unpack(pkg):
     """
     Unpack a value package into a Python value
 
-    :param pkg: The value package
+    :param pkg: The value package (or it's JSON, or binary, encoding)
     :returns: A Python value
     """
     if isinstance(pkg, str):
         pkg = json.loads(pkg)
+    elif isinstance(pkg, bytes):
+        pkg = binary.decode(pkg)
 
     if not isinstance(pkg, dict):
         raise RuntimeError('Package should be an `Object`')
@@ -362,11 +490,15 @@ def unpack(pkg):
     elif type_ == 'object' or type_ == 'array':
         return json.loads(data)
     elif type_ == 'table':
+        import pandas
+
         if format == 'json':
             dataframe = pandas.DataFrame()
             for name, column in data['data'].items():
                 dataframe[name] = column
             return dataframe
+        elif format == 'columnar':
+            return unpack_columnar(data)
         elif format in ('csv', 'tsv'):
             sep = ',' if format == 'csv' else '\t'
             return pandas.read_csv(BytesIO(data.encode()), sep=sep)
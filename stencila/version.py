@@ -7,15 +7,28 @@ Based on http://stackoverflow.com/a/17638236/4625911
 # pylint: disable=invalid-name
 
 import os.path
-from pkg_resources import get_distribution, DistributionNotFound
 
 try:
-    dist = get_distribution('stencila')
-    dist_loc = os.path.normcase(dist.location)
+    # Faster to import than `pkg_resources`, so used where available (Python >= 3.8)
+    from importlib.metadata import distribution, PackageNotFoundError as DistributionNotFound
+
+    def get_distribution(name):
+        dist = distribution(name)
+        return str(dist.locate_file('')), dist.version
+except ImportError:
+    from pkg_resources import get_distribution as get_dist, DistributionNotFound
+
+    def get_distribution(name):
+        dist = get_dist(name)
+        return dist.location, dist.version
+
+try:
+    dist_location, dist_version = get_distribution('stencila')
+    dist_loc = os.path.normcase(dist_location)
     here = os.path.normcase(__file__)
     if not here.startswith(os.path.join(dist_loc, 'stencila')):
         raise DistributionNotFound
 except DistributionNotFound:
     __version__ = '0.0.0'
 else:
-    __version__ = dist.version
+    __version__ = dist_version
@@ -0,0 +1,493 @@
+"""
+Workers used by a `Host` to run the methods of instances
+"""
+
+import importlib
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+import six
+from six.moves import queue
+
+# Modules imported by warm worker processes before they are needed,
+# so that creating and first using an instance in them is fast
+PRELOAD = ('stencila.host', 'numpy', 'pandas', 'matplotlib.pyplot')
+
+# Modules imported by the fork server (where used) so that they are
+# in memory, and shared, in the worker processes forked from it
+FORKSERVER_PRELOAD = ['stencila.host', 'numpy', 'pandas', 'matplotlib']
+
+
+class ThreadWorker(object):
+    """
+    A thread dedicated to a single instance
+
+    Some instances can only be used from the thread that created them
+    (e.g. a ``SqliteContext`` holds a SQLite connection which is bound to the thread
+    it was opened in). When a host is serving requests from multiple threads, each
+    instance is pinned to its own ``ThreadWorker``: the instance is constructed
+    on, and all of its methods are run on, the worker's thread. This allows
+    independent instances to be used in parallel while calls to the same instance
+    are serialised.
+    """
+
+    def __init__(self, name=None):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def thread(self):
+        """
+        Get the thread of this worker
+
+        :returns: A ``threading.Thread``
+        """
+        return self._thread
+
+    def run(self, func, *args, **kwargs):
+        """
+        Run a function on this worker's thread and wait for the result
+
+        Any exception raised by the function is re-raised in the calling thread.
+
+        :param func: The function to run
+        :returns: The result of the function
+        """
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+
+        done = threading.Event()
+        outcome = {}
+        self._queue.put((func, args, kwargs, done, outcome))
+        done.wait()
+        if 'error' in outcome:
+            six.reraise(*outcome['error'])
+        return outcome['result']
+
+    def stop(self):
+        """
+        Stop this worker once any queued functions have been run
+        """
+        self._queue.put(None)
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            func, args, kwargs, done, outcome = job
+            try:
+                outcome['result'] = func(*args, **kwargs)
+            except BaseException:
+                # Including e.g. `SystemExit` raised by code run in an instance,
+                # so that this thread survives to run later calls
+                outcome['error'] = sys.exc_info()
+            finally:
+                done.set()
+
+
+class ProcessWorker(object):
+    """
+    A process dedicated to a single instance
+
+    Instances in a ``ProcessWorker`` do not share the host process's GIL, so that
+    CPU intensive methods (e.g. a long running ``execute``) of one instance do not
+    stall other instances, or the host's servers. The instance is constructed in, and
+    all it's methods are run in, the worker process with arguments and results
+    passed over a pipe.
+
+    If the worker process crashes, the call that detects it raises an error and
+    the worker is restarted with a new instance (constructed using the
+    original arguments).
+
+    A worker started without a ``type`` is "warm": it imports the ``preload`` modules
+    and then waits for ``create()`` to be called to construct it's instance.
+    """
+
+    def __init__(self, context, type=None, args=None, preload=()):
+        self._context = context
+        self._type = type
+        self._args = args
+        self._preload = preload
+        self._lock = threading.Lock()
+        self._process = None
+        self._connection = None
+        self._calling = False
+        self._stopped = False
+        self._start()
+
+    @property
+    def pid(self):
+        """
+        Get the process id of this worker
+
+        :returns: A process id
+        """
+        return self._process.pid
+
+    def _start(self):
+        connection, child = self._context.Pipe()
+        self._process = self._context.Process(
+            target=process_main, args=(child, self._type, self._args, self._preload)
+        )
+        self._process.daemon = True
+        self._process.start()
+        child.close()
+        self._connection = connection
+
+        status, value = self._receive()
+        if status == 'error':
+            self.stop()
+            raise Exception(value)
+
+    def _receive(self):
+        try:
+            return self._connection.recv()
+        except (EOFError, IOError, OSError):
+            self._process.join(1)
+            code = self._process.exitcode
+            self._connection.close()
+            raise WorkerCrashed('Instance process crashed (exit code %s)' % code)
+
+    def create(self, type, args):
+        """
+        Create the instance in this (warm) worker
+
+        :param type: Type of instance
+        :param args: Arguments to be passed to type constructor
+        """
+        with self._lock:
+            self._type = type
+            self._args = args
+            try:
+                self._connection.send((type, args))
+            except (IOError, OSError):
+                pass
+            status, value = self._receive()
+        if status == 'error':
+            raise Exception(value)
+
+    def call(self, method, arg=None):
+        """
+        Call a method of the instance in this worker
+
+        :param method: Name of instance method
+        :param arg: Method argument
+        :returns: Result of method call
+        """
+        with self._lock:
+            if self._stopped:
+                raise Exception('Instance process has been stopped')
+            self._calling = True
+            try:
+                try:
+                    self._connection.send((method, arg))
+                except (IOError, OSError):
+                    pass
+                status, value = self._receive()
+            except WorkerCrashed as exc:
+                if self._stopped:
+                    # The worker was stopped (e.g. the instance deleted) during the call
+                    # so it did not crash and should not be restarted
+                    raise Exception('Instance process has been stopped')
+                self._start()
+                raise Exception('%s and has been restarted' % exc)
+            finally:
+                self._calling = False
+        if status == 'error':
+            raise Exception(value)
+        return value
+
+    def interrupt(self):
+        """
+        Interrupt the call currently running in this worker (if any)
+
+        Sends a ``SIGINT`` to the worker process, which raises a ``KeyboardInterrupt``
+        in it's main thread.
+
+        :returns: Whether or not there was a call to interrupt
+        """
+        if not self._calling:
+            return False
+        os.kill(self._process.pid, signal.SIGINT)
+        return True
+
+    def stop(self):
+        """
+        Stop this worker
+        """
+        self._stopped = True
+        try:
+            self._connection.send(None)
+        except (IOError, OSError):
+            pass
+        self._connection.close()
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class ProcessInstance(object):
+    """
+    A proxy for an instance in a ``ProcessWorker``
+
+    Attribute access returns a function that calls the instance method
+    of the same name in the worker process.
+    """
+
+    def __init__(self, worker):
+        self._worker = worker
+
+    def cancel(self, *args):
+        """
+        Cancel the method currently running in the worker process (if any)
+        """
+        return self._worker.interrupt()
+    cancel.concurrent = True
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return lambda arg=None: self._worker.call(method, arg)
+
+
+class ProcessPool(object):
+    """
+    A managed pool of ``ProcessWorker``s
+
+    Limits the number of worker processes to ``size`` (defaults to the number of CPUs).
+    Once the pool is full, ``acquire()`` returns ``None`` and the caller should create
+    the instance in it's own process instead.
+    Worker processes are started using the "spawn" method (where available) so that they
+    do not inherit the host's threads and locks.
+
+    The pool can keep a number of ``warm`` workers, which have already imported the
+    modules that instances of the ``warm_type`` need, ready to create those instances in.
+    These are started in the background, and replaced as they are used, so that bursts
+    of requests to create instances do not have to wait for new processes. Where available,
+    they are started using the "forkserver" method: a single, preloaded, server process
+    forks each of them, which is much faster than spawning and importing modules afresh.
+    """
+
+    def __init__(self, size=None, warm=0, warm_type='PythonContext'):
+        self._size = size or multiprocessing.cpu_count()
+        self._workers = set()
+        self._warm = []
+        self._warm_size = min(warm, self._size)
+        self._warm_type = warm_type
+        self._filling = False
+        self._lock = threading.Lock()
+        get_context = getattr(multiprocessing, 'get_context', None)
+        if not get_context:
+            self._context = multiprocessing
+        elif warm and 'forkserver' in multiprocessing.get_all_start_methods():
+            self._context = get_context('forkserver')
+            self._context.set_forkserver_preload(FORKSERVER_PRELOAD)
+        else:
+            self._context = get_context('spawn')
+        self.fill()
+
+    @property
+    def warm_type(self):
+        """
+        Get the type of instance that warm workers are kept ready for
+        """
+        return self._warm_type
+
+    @property
+    def size(self):
+        """
+        Get the maximum number of worker processes in this pool
+        """
+        return self._size
+
+    def acquire(self, type, args):
+        """
+        Create an instance in a new worker process
+
+        :param type: Type of instance
+        :param args: Arguments to be passed to type constructor
+        :returns: A ``ProcessWorker``, or ``None`` if the pool is full
+        """
+        spare = None
+        with self._lock:
+            if type == self._warm_type and self._warm:
+                worker = self._warm.pop()
+            else:
+                worker = None
+                if len(self._workers) >= self._size:
+                    if not self._warm:
+                        return None
+                    # Make way by stopping a warm worker
+                    spare = self._warm.pop()
+                    self._workers.discard(spare)
+                # Reserve a place in the pool while the worker starts
+                placeholder = object()
+                self._workers.add(placeholder)
+        if spare:
+            spare.stop()
+
+        if worker:
+            try:
+                worker.create(type, args)
+            except Exception:
+                self.release(worker)
+                raise
+            finally:
+                self.fill()
+            return worker
+
+        try:
+            worker = ProcessWorker(self._context, type, args)
+        finally:
+            with self._lock:
+                self._workers.discard(placeholder)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def release(self, worker):
+        """
+        Stop a worker process and remove it from the pool
+        """
+        with self._lock:
+            self._workers.discard(worker)
+        worker.stop()
+        self.fill()
+
+    def fill(self):
+        """
+        Start warm workers, in a background thread, until there are ``warm`` of them
+        """
+        with self._lock:
+            if self._filling or len(self._warm) >= self._warm_size:
+                return
+            self._filling = True
+        thread = threading.Thread(target=self._fill)
+        thread.daemon = True
+        thread.start()
+
+    def _fill(self):
+        while True:
+            with self._lock:
+                if len(self._warm) >= self._warm_size or len(self._workers) >= self._size:
+                    self._filling = False
+                    return
+            # The worker is not counted in the pool until it has started, so that
+            # instances can be created (in other workers) in the meantime
+            try:
+                worker = ProcessWorker(self._context, preload=PRELOAD)
+            except Exception:
+                with self._lock:
+                    self._filling = False
+                return
+            with self._lock:
+                # The pool may have been stopped while the worker was starting
+                surplus = len(self._warm) >= self._warm_size
+                if not surplus:
+                    self._workers.add(worker)
+                    self._warm.append(worker)
+            if surplus:
+                worker.stop()
+
+    def stop(self):
+        """
+        Stop the warm workers in this pool, and do not start any more
+        """
+        with self._lock:
+            self._warm_size = 0
+            warm = self._warm
+            self._warm = []
+            self._workers.difference_update(warm)
+        for worker in warm:
+            worker.stop()
+
+    @property
+    def warm(self):
+        """
+        Get the number of warm workers in this pool
+        """
+        return len(self._warm)
+
+
+class HostSnapshot(object):
+    """
+    A snapshot of the details of a `Host` for instances in worker processes
+
+    Instances can not hold a reference to a `Host` in another process, but
+    some need to know it's ``id`` and ``servers`` (e.g. to create data pointers).
+    """
+
+    def __init__(self, host):
+        self.id = host.id
+        self.servers = host.servers
+
+
+def process_main(connection, type=None, args=None, preload=()):
+    """
+    The main loop of a worker process
+    """
+    if preload:
+        # Plots are rendered using the non-interactive backend
+        from .python_context import use_matplotlib_backend
+        use_matplotlib_backend()
+        for module in preload:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+
+    from .host import TYPES
+
+    if type is None:
+        # A warm worker: signal that it is ready and wait to be told what to create
+        connection.send(('ok', None))
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        type, args = message
+
+    try:
+        instance = TYPES[type](**args)
+    except Exception as exc:
+        connection.send(('error', str(exc)))
+        return
+    connection.send(('ok', None))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            # An interrupt which arrived after the call it was for had finished
+            continue
+        if message is None:
+            break
+
+        method, arg = message
+        try:
+            func = getattr(instance, method)
+        except AttributeError:
+            connection.send(('error', 'Unknown method: %s' % method))
+            continue
+        try:
+            result = func(arg)
+            connection.send(('ok', result))
+        except KeyboardInterrupt:
+            connection.send(('error', 'Call was cancelled'))
+        except Exception as exc:
+            # Including errors in pickling the result
+            connection.send(('error', str(exc)))
@@ -0,0 +1,38 @@
+import threading
+import time
+
+from stencila.admission import Limiter, Overloaded
+
+import pytest
+
+
+def test_limiter():
+    limiter = Limiter(1, queue=1)
+
+    limiter.acquire()
+    assert limiter.active == 1
+
+    # Deadline passes while waiting
+    with pytest.raises(Overloaded) as exc:
+        limiter.acquire(time.time() + 0.05)
+    exc.match('Deadline passed')
+    assert limiter.waiting == 0
+
+    # Waits until released
+    thread = threading.Thread(target=limiter.acquire)
+    thread.start()
+    while not limiter.waiting:
+        time.sleep(0.01)
+
+    # Queue is full
+    with pytest.raises(Overloaded) as exc:
+        limiter.acquire()
+    exc.match('Too many calls waiting')
+
+    limiter.release()
+    thread.join(1)
+    assert not thread.is_alive()
+    assert limiter.active == 1 and limiter.waiting == 0
+
+    limiter.release()
+    assert limiter.active == 0
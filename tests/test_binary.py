@@ -0,0 +1,74 @@
+import array
+
+import numpy
+import pytest
+
+from stencila.binary import encode, decode
+
+
+def test_round_trip():
+    values = [
+        None, True, False,
+        0, 127, 128, 255, 256, 65535, 65536, 2**32, 2**64 - 1,
+        -1, -32, -33, -128, -129, -32768, -32769, -2**31 - 1, -2**63,
+        1.5, -0.25,
+        '', 'a' * 31, 'a' * 32, u'é' * 300, 'x' * 70000,
+        b'\x00' * 10, b'x' * 300,
+        [], [1] * 15, [1] * 16, list(range(70000)), [1, 'a'] * 5,
+        {}, {'a': 1}, dict((str(i), i) for i in range(20)), dict((str(i), i) for i in range(70000)),
+        {'type': 'table', 'data': {'a': [0.5] * 10, 'b': list(range(10)), 'c': [True, False] * 5}}
+    ]
+    for value in values:
+        assert decode(encode(value)) == value
+
+
+def test_typed_arrays():
+    # Lists of numbers are encoded compactly
+    assert len(encode([0.5] * 1000)) < 8100
+    assert len(encode(list(range(1000)))) < 8100
+    # Unless they are mixed or can not fit
+    assert decode(encode([1, 1.5] * 10)) == [1, 1.5] * 10
+    assert decode(encode([2**63] * 10)) == [2**63] * 10
+
+    assert decode(encode(array.array('H', [1, 2, 3]))) == [1, 2, 3]
+    assert decode(encode(array.array('d', [1.5, 2.5]))) == [1.5, 2.5]
+
+    assert decode(encode(numpy.arange(10, dtype='>i4'))) == list(range(10))
+    assert decode(encode(numpy.arange(10, dtype='u1'))) == list(range(10))
+    assert decode(encode(numpy.linspace(0, 1, 11))) == numpy.linspace(0, 1, 11).tolist()
+    assert decode(encode(numpy.array([True, False]))) == [True, False]
+    assert decode(encode(numpy.zeros((2, 2)))) == [[0, 0], [0, 0]]
+    assert decode(encode(numpy.float32(1.5))) == 1.5
+    assert decode(encode(numpy.int64(42))) == 42
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        encode(2**64)
+    with pytest.raises(TypeError):
+        encode(object())
+    with pytest.raises(ValueError):
+        decode(b'\xc1')
+    with pytest.raises(ValueError):
+        decode(b'\x01\x02')
+
+    # Malformed data
+    for data in (
+        b'',
+        b'\x92\x01',  # Truncated array
+        b'\x81\x01',  # Truncated map
+        b'\xcb\x00',  # Truncated float
+        b'\xcd\x01',  # Truncated integer
+        b'\xda\x00\x10ab',  # Truncated string
+        b'\xda\x00',  # Truncated string length
+        b'\xc4\x05ab',  # Truncated binary
+        b'\xc7\x05\x01ab',  # Truncated extension type
+        b'\xd4',  # Truncated fixed extension type
+        b'\xc7\x00\x01',  # Typed array without an item type
+        b'\xc7\x02\x01z\x00',  # Typed array with an unknown item type
+        b'\xc7\x04\x01d\x00\x00\x00',  # Typed array with a partial item
+        b'\x81\x91\x01\x01',  # Map with an unhashable key
+        b'\xa2\xff\xfe'  # Invalid UTF-8
+    ):
+        with pytest.raises(ValueError):
+            decode(data)
@@ -0,0 +1,126 @@
+import json
+import re
+import socket
+
+import six
+import pytest
+
+if six.PY2:
+    pytest.skip('HostAsyncioServer requires Python 3', allow_module_level=True)
+
+from six.moves import http_client
+
+from stencila.host import Host, host
+from stencila.host_asyncio_server import HostAsyncioServer
+
+from werkzeug.wrappers import Response
+from werkzeug.test import Client
+
+
+def connect(server):
+    match = re.match(r'^http://(.+):(\d+)$', server.url)
+    return http_client.HTTPConnection(match.group(1), int(match.group(2)), timeout=10)
+
+
+def test_start_stop():
+    server = HostAsyncioServer(host)
+
+    server.start()
+    assert re.match('^http://127.0.0.1', server.url)
+
+    server.stop()
+    assert server.url is None
+
+
+def test_route():
+    server = HostAsyncioServer(host)
+
+    assert server.route('GET', '/manifest') == ('run', 'manifest')
+    assert server.route('POST', '/type', True) == ('run', 'create', 'type')
+    assert server.route('PUT', '/id!method', True) == ('run', 'call', 'id', 'method')
+
+
+def test_handle():
+    server = HostAsyncioServer(host)
+    client = Client(server, Response)
+
+    response = client.get('/')
+    assert response.status == '200 OK'
+
+    response = client.post('/PythonContext')
+    assert response.status_code == 401
+
+
+def test_requests():
+    # Use a separate host so that instance names in other tests are unaffected
+    h = Host()
+    server = HostAsyncioServer(h)
+    server.start()
+
+    # Several requests can be made over a single connection
+    conn = connect(server)
+    headers = {'Authorization': 'Bearer %s' % h.generate_token()}
+
+    conn.request('GET', '/manifest')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert json.loads(response.read().decode())['stencila']['package'] == 'py'
+
+    conn.request('POST', '/PythonContext', headers=headers)
+    response = conn.getresponse()
+    assert response.status == 200
+    id = json.loads(response.read().decode())
+
+    # Request tokens are single use, so later requests use the session cookie
+    headers = {'Cookie': response.getheader('Set-Cookie').split(';')[0]}
+
+    conn.request('PUT', '/%s!execute' % id, body='{"code":"6*7"}', headers=headers)
+    response = conn.getresponse()
+    assert response.status == 200
+    cell = json.loads(response.read().decode())
+    assert cell['outputs'][0]['value']['data'] == 42
+
+    conn.request('DELETE', '/%s' % id, headers=headers)
+    response = conn.getresponse()
+    assert response.status == 200
+    response.read()
+
+    conn.close()
+    server.stop()
+
+
+def test_malformed_requests():
+    server = HostAsyncioServer(Host())
+    server.start()
+    match = re.match(r'^http://(.+):(\d+)$', server.url)
+
+    for request in (b'GARBAGE\r\n\r\n', b'GET / FTP/1.0\r\n\r\n', b'PUT / HTTP/1.1\r\nContent-Length: x\r\n\r\n'):
+        sock = socket.create_connection((match.group(1), int(match.group(2))), timeout=10)
+        sock.sendall(request)
+        response = b''
+        while True:
+            data = sock.recv(1024)
+            if not data:
+                break
+            response += data
+        sock.close()
+        assert response.startswith(b'HTTP/1.1 400 Bad Request')
+
+    # The server is still serving requests
+    conn = connect(server)
+    conn.request('GET', '/manifest')
+    assert conn.getresponse().status == 200
+    conn.close()
+
+    server.stop()
+
+
+def test_host_start_asynchronous():
+    h = Host()
+
+    h.start(quiet=True, asynchronous=True)
+    assert isinstance(h._servers['http'], HostAsyncioServer)
+    assert h._threaded
+
+    h.stop(quiet=True)
+    assert len(h.servers) == 0
@@ -1,20 +1,87 @@
+import gzip
+import io
 import re
 import json
+import os
+import pstats
+import time
+import zlib
+from collections import OrderedDict
 
-from stencila.host import host
-from stencila.host_http_server import HostHttpServer
-from stencila.value import pack
+import numpy
+
+from stencila.host import Host, host
+from stencila import host_http_server
+from stencila.host_http_server import HostHttpServer, to_json, iter_json
+from stencila.value import pack, unpack
+from stencila import binary
 
 from werkzeug.wrappers import Request, Response
 from werkzeug.test import Client, EnvironBuilder
 
 import pytest
+import six
+from six.moves import http_client
+from six.moves.urllib.parse import quote
+
+if six.PY3:
+    from stencila.host_asyncio_server import HostAsyncioServer
+    SERVERS = [HostHttpServer, HostAsyncioServer]
+else:
+    HostAsyncioServer = None
+    SERVERS = [HostHttpServer]
 
 
 def request(**kwargs):
     return Request(EnvironBuilder(**kwargs).get_environ())
 
 
+@pytest.fixture(params=SERVERS, ids=[Server.__name__ for Server in SERVERS])
+def serve(request):
+    """
+    Create a server, of each type, and a werkzeug test client for it
+
+    Requests to a ``HostAsyncioServer`` are forwarded over a connection to it
+    (so that it's reading of requests and writing of responses are tested).
+    """
+    started = []
+
+    def serve(*args, **kwargs):
+        server = request.param(*args, **kwargs)
+        if request.param is HostAsyncioServer:
+            server.start()
+            started.append(server)
+            return server, Client(forward(server), Response)
+        return server, Client(server, Response)
+    yield serve
+    for server in started:
+        server.stop()
+
+
+def forward(server):
+    """
+    Create a WSGI application which forwards requests to a started server
+    """
+    match = re.match(r'^http://(.+):(\d+)$', server.url)
+
+    def app(environ, start_response):
+        req = Request(environ)
+        path = quote(environ['PATH_INFO'])
+        if environ.get('QUERY_STRING'):
+            path += '?' + environ['QUERY_STRING']
+        connection = http_client.HTTPConnection(match.group(1), int(match.group(2)), timeout=10)
+        connection.request(req.method, path, req.get_data() or None, dict(req.headers))
+        response = connection.getresponse()
+        data = response.read()
+        connection.close()
+        start_response('%s %s' % (response.status, response.reason), [
+            (name, value) for name, value in response.getheaders()
+            if name.lower() not in ('connection', 'transfer-encoding')
+        ])
+        return [data]
+    return app
+
+
 def test_start_stop():
     server = HostHttpServer(host)
 
@@ -25,23 +92,27 @@ def test_start_stop():
     assert server.url is None
 
 
-def test_handle():
-    server = HostHttpServer(host)
-    client = Client(server, Response)
-
-    server.start()
+def test_handle(serve):
+    server, client = serve(host)
 
     response = client.get('/')
     assert response.status == '200 OK'
 
-    server.stop()
+    # Unauthorized requests are errors
+    response = client.get('/foo')
+    assert response.status == '401 UNAUTHORIZED'
 
+    # CORS headers are set for allowed origins
+    response = client.open('/manifest', method='OPTIONS', headers={'Origin': 'http://localhost:3000'})
+    assert response.headers['Access-Control-Allow-Origin'] == 'http://localhost:3000'
+    assert 'PUT' in response.headers['Access-Control-Allow-Methods']
+    response = client.open('/manifest', method='OPTIONS', headers={'Origin': 'http://evil.example'})
+    assert 'Access-Control-Allow-Origin' not in response.headers
 
-def test_handle_authorization():
-    server = HostHttpServer(host)
-    client = Client(server, Response)
 
-    server.start()
+def test_handle_authorization(serve):
+    h = Host()
+    server, client = serve(h)
 
     response = client.post('/PythonContext')
     assert response.status_code == 401
@@ -49,12 +120,43 @@ def test_handle_authorization():
     def auth_headers (token):
         return {'Authorization': 'Bearer %s' % token}
 
-    token1 = host.generate_token()
+    token1 = h.generate_token()
     response = client.post('/PythonContext', headers = auth_headers(token1))
     assert response.data.decode() == '"pythonContext1"'
     assert response.status_code == 200
 
-    server.stop()
+
+def test_handle_session(serve):
+    h = Host()
+    server, client = serve(h)
+
+    # A session cookie is issued after an authorized request...
+    response = client.get('/manifest', headers={'Authorization': 'Bearer %s' % h.generate_token()})
+    assert 'session=' in response.headers['Set-Cookie']
+    # (and is not sent by browsers with cross site requests)
+    assert 'SameSite=Strict' in response.headers['Set-Cookie']
+
+    # ...and can be used to authorize subsequent requests
+    response = client.post('/PythonContext')
+    assert response.status_code == 200
+
+    # The session cookie is not accepted for requests from other origins
+    response = client.post('/PythonContext', headers={'Origin': 'http://evil.example'})
+    assert response.status_code == 401
+    response = client.post('/PythonContext', headers={'Referer': 'http://evil-site.example/page'})
+    assert response.status_code == 401
+    response = client.post('/PythonContext', headers={'Origin': 'http://localhost:3000'})
+    assert response.status_code == 200
+
+    # Bodies which can be sent by forms on other sites are rejected
+    response = client.post('/batch', data='[]', content_type='text/plain')
+    assert response.status_code == 415
+    response = client.post('/batch', data='[]', content_type='application/json')
+    assert response.status_code == 200
+
+    client.cookie_jar.clear()
+    response = client.post('/PythonContext')
+    assert response.status_code == 401
 
 
 def test_route():
@@ -70,6 +172,11 @@ def test_route():
 
     assert server.route('DELETE', '/id', True) == ('run', 'delete', 'id')
 
+    assert server.route('POST', '/batch', True) == ('run', 'batch')
+    assert server.route('POST', '/batch') == ('error401', '/batch')
+
+    assert server.route('GET', '/metrics') == ('metrics',)
+
 
 def test_static():
     server = HostHttpServer(host)
@@ -88,6 +195,41 @@ def test_static():
     assert res.status == '403 FORBIDDEN'
 
 
+def test_static_caching(serve):
+    server, client = serve(host)
+
+    res = client.get('/static/logo-name-beta.svg')
+    assert res.status_code == 200
+    assert res.headers['Cache-Control'] == 'public, max-age=3600'
+    assert 'Content-Encoding' not in res.headers
+    etag = res.headers['ETag']
+    modified = res.headers['Last-Modified']
+    data = res.data
+
+    # Conditional requests
+    res = client.get('/static/logo-name-beta.svg', headers={'If-None-Match': etag})
+    assert res.status_code == 304
+    res = client.get('/static/logo-name-beta.svg', headers={'If-Modified-Since': modified})
+    assert res.status_code == 304
+
+    # Range requests
+    res = client.get('/static/logo-name-beta.svg', headers={'Range': 'bytes=0-9'})
+    assert res.status_code == 206
+    assert res.data == data[:10]
+
+    # Compressed variant
+    res = client.get('/static/logo-name-beta.svg', headers={'Accept-Encoding': 'gzip'})
+    assert res.status_code == 200
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.headers['ETag'] != etag
+    assert gzip.GzipFile(fileobj=io.BytesIO(res.data)).read() == data
+
+    # Binary files are served as is
+    res = client.get('/static/favicon.ico', headers={'Accept-Encoding': 'gzip'})
+    assert res.status_code == 200
+    assert 'Content-Encoding' not in res.headers
+
+
 def test_run():
     server = HostHttpServer(host)
     req = request()
@@ -116,3 +258,334 @@ def test_run():
     # Delete the context
     res = server.run(req, res, 'delete', id)
     assert res.status == '200 OK'
+
+
+def test_run_batch():
+    server = HostHttpServer(Host())
+
+    req = request(data=json.dumps([
+        {'verb': 'create', 'id': 'PythonContext'},
+        {'verb': 'call', 'id': 'pythonContext1', 'method': 'execute', 'arg': {'code': '6*7'}}
+    ]))
+    res = server.run(req, Response(), 'batch')
+    assert res.status == '200 OK'
+    results = json.loads(res.data.decode())
+    assert results[0] == {'result': 'pythonContext1'}
+    assert results[1]['result']['outputs'][0]['value']['data'] == 42
+
+
+def test_compress():
+    server = HostHttpServer(host, compression_threshold=100)
+    data = json.dumps(list(range(1000)))
+
+    def compress(data, encoding=None, level=6):
+        headers = {'Accept-Encoding': encoding} if encoding else {}
+        res = Response(data)
+        return server.compress(request(headers=headers), res, level)
+
+    # Not compressed if the client does not accept it, it's too small,
+    # or the level is zero
+    assert compress(data).data.decode() == data
+    assert 'Content-Encoding' not in compress('[1, 2, 3]', 'gzip').headers
+    assert 'Content-Encoding' not in compress(data, 'gzip', 0).headers
+
+    res = compress(data, 'gzip')
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in res.headers
+    assert gzip.GzipFile(fileobj=io.BytesIO(res.data)).read().decode() == data
+
+    res = compress(data, 'deflate;q=1.0, gzip;q=0.5')
+    assert res.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(res.data).decode() == data
+
+
+def test_run_compressed():
+    server = HostHttpServer(host, compression_threshold=0, compression_levels={'call!execute': 9})
+
+    res = server.run(request(), Response(), 'create', 'PythonContext')
+    id = json.loads(res.data.decode())
+
+    req = request(data='{"code":"6*7"}', headers={'Accept-Encoding': 'gzip'})
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert res.headers['Content-Encoding'] == 'gzip'
+    cell = json.loads(gzip.GzipFile(fileobj=io.BytesIO(res.data)).read().decode())
+    assert cell['outputs'][0]['value']['data'] == 42
+    assert res.vary.as_set() == set(['accept', 'accept-encoding'])
+
+
+def test_to_json():
+    class Thing(object):
+        def __init__(self):
+            self.a = 1
+            self._b = 2
+
+    assert to_json(OrderedDict([('b', 1), ('a', [1, 2.5, None, True, 'x'])])) == '{"b": 1, "a": [1, 2.5, null, true, "x"]}'
+    assert to_json(set([1])) == '[1]'
+    assert to_json(Thing()) == '{"a": 1}'
+    assert to_json(numpy.int64(42)) == '42'
+    assert to_json(numpy.array([1.5, 2.5])) == '[1.5, 2.5]'
+
+    with pytest.raises(TypeError):
+        to_json(object())
+
+
+def test_iter_json():
+    value = {'data': list(range(100000))}
+
+    chunks = list(iter_json(value, chunk_size=1000))
+    assert len(chunks) > 10
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    assert json.loads(b''.join(chunks).decode()) == value
+
+    # Encoded the same as in one go, including values nested in
+    # dictionaries and lists and dictionaries without string keys
+    value = OrderedDict([
+        ('a', 1),
+        ('b', [{'c': list(range(25000))}, 'd']),
+        ('e', {1: list(range(20000))}),
+        ('f', numpy.arange(3))
+    ])
+    assert b''.join(iter_json(value)).decode() == to_json(value)
+
+    # Small values are encoded in one go
+    assert list(iter_json({'a': [1, 2]})) == [b'{"a": [1, 2]}']
+    assert list(iter_json([])) == [b'[]']
+
+
+def test_run_streamed():
+    server = HostHttpServer(host)
+
+    res = server.run(request(), Response(), 'create', 'PythonContext')
+    id = json.loads(res.data.decode())
+
+    # Large results are streamed without a content length
+    req = request(data='{"code":"x = list(range(100000))"}')
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert res.content_length is None
+    cell = json.loads(res.data.decode())
+    assert cell['outputs'][0]['value']['data'] == list(range(100000))
+
+
+def test_metrics(serve):
+    myhost = Host()
+    server, client = serve(myhost)
+
+    id = json.loads(server.run(request(), Response(), 'create', 'PythonContext').data.decode())
+    server.run(request(data='{"code":"x = 1"}'), Response(), 'call', id, 'execute')
+    client.get('/manifest')
+    client.get('/foo')
+
+    res = client.get('/metrics')
+    assert res.status == '200 OK'
+    assert res.headers['content-type'].startswith('text/plain')
+    text = res.data.decode()
+    assert 'stencila_requests_total{route="manifest",status="200"} 1' in text
+    assert 'stencila_requests_total{route="error401",status="401"} 1' in text
+    assert 'stencila_call_duration_seconds_count{type="PythonContext",method="execute"} 1' in text
+    assert 'stencila_call_result_bytes_count{type="PythonContext",method="execute"} 1' in text
+    assert 'stencila_instances{type="PythonContext"} 1' in text
+
+
+def test_run_profiled():
+    server = HostHttpServer(Host())
+
+    res = server.run(request(), Response(), 'create', 'PythonContext')
+    id = json.loads(res.data.decode())
+
+    req = request(data='{"code":"sum(range(1000))"}')
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert 'X-Stencila-Profile' not in res.headers
+
+    req = request(data='{"code":"sum(range(1000))"}', headers={'X-Stencila-Profile': '1'})
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert json.loads(res.data.decode())['outputs'][0]['value']['data'] == 499500
+    path = res.headers['X-Stencila-Profile']
+    assert os.path.isfile(path)
+    stats = pstats.Stats(path)
+    assert any(func[2] == 'execute' for func in stats.stats)
+
+    req = request(query_string='profile=1', data='{"code":"1"}')
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert os.path.isfile(res.headers['X-Stencila-Profile'])
+
+
+def test_run_profiled_pruned(monkeypatch, tmpdir):
+    myhost = Host()
+    monkeypatch.setattr(myhost, 'temp_dir', lambda: str(tmpdir))
+    monkeypatch.setattr(host_http_server, 'PROFILES_KEPT', 2)
+    server = HostHttpServer(myhost)
+
+    res = server.run(request(), Response(), 'create', 'PythonContext')
+    id = json.loads(res.data.decode())
+
+    # Only the most recent profiles are kept
+    paths = []
+    for index in range(4):
+        req = request(data='{"code":"1"}', headers={'X-Stencila-Profile': '1'})
+        res = server.run(req, Response(), 'call', id, 'execute')
+        paths.append(res.headers['X-Stencila-Profile'])
+        time.sleep(0.01)
+    assert sorted(os.listdir(str(tmpdir.join('profiles')))) == sorted(os.path.basename(path) for path in paths[-2:])
+
+
+def test_run_deadline(serve):
+    myhost = Host()
+    myhost._instance_concurrency = 1
+    server, client = serve(myhost)
+
+    def put(deadline):
+        return client.put('/%s!execute' % id, data='{"code":"1"}', headers={
+            'Authorization': 'Bearer ' + myhost.generate_token(),
+            'X-Stencila-Deadline': deadline
+        })
+
+    id = json.loads(server.run(request(), Response(), 'create', 'PythonContext').data.decode())
+
+    assert put('1').status == '200 OK'
+    assert put('soon').status == '400 BAD REQUEST'
+
+    # Occupy the instance so that the next call can not start before its deadline
+    myhost._limiters[id].acquire()
+    res = put('0.05')
+    assert res.status == '503 SERVICE UNAVAILABLE'
+    assert res.headers['Retry-After'] == '1'
+    assert 'Deadline passed' in res.data.decode()
+
+    # Deadlines can also be absolute
+    res = client.put('/%s!execute' % id, data='{"code":"1"}', headers={
+        'Authorization': 'Bearer ' + myhost.generate_token(),
+        'X-Stencila-Deadline-At': str(time.time() + 0.05)
+    })
+    assert res.status == '503 SERVICE UNAVAILABLE'
+    myhost._limiters[id].release()
+
+    req = request(headers={'X-Stencila-Deadline': '60', 'X-Stencila-Deadline-At': '1000'})
+    assert server.deadline(req) == 1000
+    req = request(headers={'X-Stencila-Deadline-At': 'soon'})
+    with pytest.raises(ValueError):
+        server.deadline(req)
+
+    # A call is not started after its deadline
+    with pytest.raises(Exception) as exc:
+        myhost.call(id, 'execute', {'code': '1'}, deadline=time.time() - 1)
+    exc.match('Deadline passed')
+
+
+def test_keep_alive():
+    myhost = Host()
+    server = HostHttpServer(myhost, port=2500, threaded=True, keep_alive_timeout=0.5, keep_alive_requests=4)
+    server.start()
+    id = myhost.create('PythonContext')
+
+    connection = http_client.HTTPConnection('127.0.0.1', server._port)
+
+    def request(method, path, body=None):
+        connection.request(method, path, body, {'Authorization': 'Bearer ' + myhost.generate_token()})
+        response = connection.getresponse()
+        return response, response.read()
+
+    response, body = request('GET', '/manifest')
+    assert response.version == 11
+    assert response.getheader('Content-Length') == str(len(body))
+    sock = connection.sock
+
+    # Bodies of unknown length are chunked and the connection is kept alive
+    response, body = request('PUT', '/%s!execute' % id, '{"code":"list(range(100000))"}')
+    assert response.getheader('Transfer-Encoding') == 'chunked'
+    assert json.loads(body.decode())['outputs'][0]['value']['data'] == list(range(100000))
+    assert connection.sock is sock
+
+    # Unread request bodies do not corrupt the next request
+    connection.request('PUT', '/%s!execute' % id, '{"code": "unread"}')
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 401
+    response, body = request('GET', '/manifest')
+    assert response.status == 200
+
+    # Closed after the maximum number of requests
+    assert response.getheader('Connection') == 'close'
+    assert connection.sock is None
+
+    # Closed after being idle
+    request('GET', '/manifest')
+    sock = connection.sock
+    time.sleep(1)
+    assert sock.recv(1) == b''
+
+    connection.close()
+    server.stop()
+
+
+def test_run_binary():
+    server = HostHttpServer(Host())
+
+    id = json.loads(server.run(request(), Response(), 'create', 'PythonContext').data.decode())
+    code = 'import numpy, pandas\npandas.DataFrame({"a": numpy.arange(100) / 7, "b": numpy.arange(100)})'
+
+    res = server.run(request(data=json.dumps({'code': code})), Response(), 'call', id, 'execute')
+    assert res.headers['Content-Type'] == 'application/json'
+    size = len(res.data)
+
+    req = request(
+        data=binary.encode({'code': code}),
+        headers={'Content-Type': binary.MEDIA_TYPE, 'Accept': binary.MEDIA_TYPE}
+    )
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert res.headers['Content-Type'] == binary.MEDIA_TYPE
+    assert 'Accept' in res.headers['Vary']
+    assert len(res.data) < size
+    table = unpack(binary.encode(binary.decode(res.data)['outputs'][0]['value']))
+    assert list(table['a']) == (numpy.arange(100) / 7).tolist()
+    assert list(table['b']) == list(range(100))
+
+    # Malformed bodies are bad requests
+    req = request(data=b'\x92\x01', headers={'Content-Type': binary.MEDIA_TYPE})
+    assert server.run(req, Response(), 'call', id, 'execute').status == '400 BAD REQUEST'
+    req = request(data='{"code":', headers={'Content-Type': 'application/json'})
+    assert server.run(req, Response(), 'call', id, 'execute').status == '400 BAD REQUEST'
+
+
+def test_run_stream():
+    server = HostHttpServer(Host())
+
+    id = json.loads(server.run(request(), Response(), 'create', 'PythonContext').data.decode())
+
+    req = request(data='{"code":"print(1)\\nprint(2)\\n3"}', headers={'Accept': 'text/event-stream'})
+    res = server.run(req, Response(), 'call', id, 'execute')
+    assert res.headers['Content-Type'] == 'text/event-stream'
+    events = []
+    for block in res.data.decode().strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[7:], json.loads(data[6:])))
+    assert [event for event, data in events] == ['start', 'stdout', 'stdout', 'stdout', 'stdout', 'end', 'result']
+    assert events[-1][1]['outputs'][0]['value']['data'] == 3
+
+    req = request(data='{"code":"1"}', headers={'Accept': 'text/event-stream'})
+    res = server.run(req, Response(), 'call', 'foo', 'execute')
+    assert res.data.decode() == 'event: error\ndata: {"message": "Unknown instance: foo"}\n\n'
+
+    # Methods that do not emit events are called on the request's thread
+    id = json.loads(server.run(request(), Response(), 'create', 'SqliteContext').data.decode())
+    req = request(data='{"type":"cell","code":"SELECT 42 AS answer"}', headers={'Accept': 'text/event-stream'})
+    res = server.run(req, Response(), 'call', id, 'execute')
+    event, data = res.data.decode().strip().split('\n')
+    assert event == 'event: result'
+    assert not json.loads(data[6:])['messages']
+
+
+def test_run_stream_deadline(serve):
+    myhost = Host()
+    myhost._instance_concurrency = 1
+    server, client = serve(myhost)
+    id = myhost.create('PythonContext')
+
+    # Calls that can not be started by their deadline are rejected before streaming
+    myhost._limiters[id].acquire()
+    res = client.put('/%s!execute' % id, data='{"code":"1"}', headers={
+        'Authorization': 'Bearer ' + myhost.generate_token(),
+        'Accept': 'text/event-stream',
+        'X-Stencila-Deadline': '0.05'
+    })
+    assert res.status == '503 SERVICE UNAVAILABLE'
+    myhost._limiters[id].release()
@@ -0,0 +1,45 @@
+from stencila.host import Host
+from stencila.host_metrics import Counter, Histogram, HostMetrics
+
+
+def test_counter():
+    counter = Counter('requests', 'Requests', ('route',))
+    counter.inc(('a',))
+    counter.inc(('a',), 2)
+    counter.inc(('b',))
+    assert sorted(counter.samples()) == [
+        ('requests', '{route="a"}', 3),
+        ('requests', '{route="b"}', 1)
+    ]
+
+
+def test_histogram():
+    histogram = Histogram('durations', 'Durations', buckets=(1, 2))
+    histogram.observe(0.5)
+    histogram.observe(1)
+    histogram.observe(3)
+    assert list(histogram.samples()) == [
+        ('durations_bucket', '{le="1"}', 2),
+        ('durations_bucket', '{le="2"}', 2),
+        ('durations_bucket', '{le="+Inf"}', 3),
+        ('durations_sum', '', 4.5),
+        ('durations_count', '', 3)
+    ]
+
+
+def test_host_metrics():
+    host = Host()
+    metrics = HostMetrics(host)
+    host.create('PythonContext')
+
+    metrics.request('call', 200, 0.01)
+    metrics.call('PythonContext', 'execute', 0.01)
+    metrics.call_size('PythonContext', 'execute', 100)
+
+    text = metrics.render()
+    assert '# TYPE stencila_requests_total counter' in text
+    assert 'stencila_requests_total{route="call",status="200"} 1' in text
+    assert 'stencila_request_duration_seconds_bucket{route="call",le="0.01"} 1' in text
+    assert 'stencila_call_duration_seconds_sum{type="PythonContext",method="execute"} 0.01' in text
+    assert 'stencila_call_result_bytes_bucket{type="PythonContext",method="execute",le="256"} 1' in text
+    assert 'stencila_instances{type="PythonContext"} 1' in text
@@ -0,0 +1,157 @@
+import base64
+import json
+import os
+import re
+import socket
+import struct
+
+import six
+import pytest
+
+if six.PY2:
+    pytest.skip('HostWebsocketServer requires Python 3', allow_module_level=True)
+
+from stencila import binary
+from stencila.host import Host
+from stencila.host_websocket_server import HostWebsocketServer, unmask
+
+
+class Client(object):
+    """
+    A minimal Websocket client for testing
+    """
+
+    def __init__(self, server, query='', headers=''):
+        match = re.match(r'^ws://(.+):(\d+)$', server.url)
+        self.socket = socket.create_connection((match.group(1), int(match.group(2))), timeout=10)
+        self.file = self.socket.makefile('rb')
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.socket.sendall((
+            'GET /%s HTTP/1.1\r\n'
+            'Host: localhost\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Key: %s\r\n'
+            'Sec-WebSocket-Version: 13\r\n%s\r\n' % (query, key, headers)
+        ).encode())
+        self.status = self.file.readline().decode().strip()
+        while self.file.readline() not in (b'\r\n', b''):
+            pass
+
+    def send(self, message, opcode=0x1):
+        payload = json.dumps(message).encode() if opcode == 0x1 else message
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            head = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+        else:
+            head = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+        self.socket.sendall(head + mask + unmask(payload, mask))
+
+    def receive(self):
+        head = self.file.read(2)
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.file.read(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.file.read(8))[0]
+        payload = self.file.read(length)
+        return json.loads(payload.decode()) if head[0] & 0x0F == 0x1 else payload
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def test_unmask():
+    mask = b'\x01\x02\x03\x04'
+    assert unmask(b'', mask) == b''
+    assert unmask(unmask(b'Hello world!', mask), mask) == b'Hello world!'
+    assert unmask(b'\x00\x00\x00\x00\x00', mask) == b'\x01\x02\x03\x04\x01'
+
+
+def test_start_stop():
+    server = HostWebsocketServer(Host())
+
+    server.start()
+    assert re.match('^ws://127.0.0.1', server.url)
+
+    server.stop()
+    assert server.url is None
+
+
+def test_authorization():
+    host = Host()
+    server = HostWebsocketServer(host)
+    server.start()
+
+    client = Client(server)
+    assert client.status == 'HTTP/1.1 401 Unauthorized'
+    client.close()
+
+    client = Client(server, '?token=foo')
+    assert client.status == 'HTTP/1.1 403 Forbidden'
+    client.close()
+
+    client = Client(server, '?token=%s' % host.generate_token())
+    assert client.status == 'HTTP/1.1 101 Switching Protocols'
+    client.close()
+
+    # Session cookies are only accepted from allowed origins
+    cookie = 'Cookie: session=%s\r\n' % host.generate_session()
+    client = Client(server, headers=cookie)
+    assert client.status == 'HTTP/1.1 101 Switching Protocols'
+    client.close()
+
+    client = Client(server, headers=cookie + 'Origin: http://localhost:3000\r\n')
+    assert client.status == 'HTTP/1.1 101 Switching Protocols'
+    client.close()
+
+    client = Client(server, headers=cookie + 'Origin: http://evil.example\r\n')
+    assert client.status == 'HTTP/1.1 403 Forbidden'
+    client.close()
+
+    server.stop()
+
+
+def test_messages():
+    host = Host()
+    server = HostWebsocketServer(host)
+    server.start()
+
+    client = Client(server, '?token=%s' % host.generate_token())
+
+    client.send({'id': 1, 'method': 'create', 'params': ['PythonContext']})
+    assert client.receive() == {'id': 1, 'result': 'pythonContext1'}
+
+    # Several requests can be in flight at once
+    client.send({'id': 2, 'method': 'call', 'params': ['pythonContext1', 'execute', {'code': '6*7'}]})
+    client.send({'id': 3, 'method': 'call', 'params': ['foo', 'bar']})
+    responses = dict((response['id'], response) for response in [client.receive(), client.receive()])
+    assert responses[2]['result']['outputs'][0]['value']['data'] == 42
+    assert responses[3]['error'] == {'message': 'Unknown instance: foo'}
+
+    client.send({'id': 4, 'method': 'start'})
+    assert client.receive() == {'id': 4, 'error': {'message': 'Unknown method: start'}}
+
+    client.send(b'ping', opcode=0x9)
+    assert client.receive() == b'ping'
+
+    # Binary messages are encoded using the binary format
+    client.send(binary.encode({'id': 5, 'method': 'call', 'params': ['pythonContext1', 'execute', {'code': '6*7'}]}), opcode=0x2)
+    response = binary.decode(client.receive())
+    assert response['id'] == 5
+    assert response['result']['outputs'][0]['value']['data'] == 42
+
+    client.close()
+    server.stop()
+
+
+def test_host_start_websocket():
+    host = Host()
+
+    host.start(quiet=True, websocket=True)
+    assert re.match('^ws://127.0.0.1', host.manifest()['servers']['ws']['url'])
+
+    host.stop(quiet=True)
+    assert len(host.servers) == 0
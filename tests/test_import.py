@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+
+# Maximum number of seconds that importing `stencila` should take. This is
+# generous, to avoid spurious failures on slow machines, but is well short of
+# the time taken to import the heavy dependencies.
+IMPORT_TIME_BUDGET = 1.0
+
+# Modules which should only be imported when they are needed
+HEAVY_MODULES = ['matplotlib', 'numpy', 'pandas', 'sphinxcontrib.napoleon']
+
+SCRIPT = '''
+import json, sys, timeit
+start = timeit.default_timer()
+import stencila
+%s
+print(json.dumps({
+    'time': timeit.default_timer() - start,
+    'modules': [name for name in %r if name in sys.modules]
+}))
+'''
+
+
+def run(code=''):
+    # Run in a new interpreter so that modules imported by other tests are not counted
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % (code, HEAVY_MODULES)])
+    return json.loads(output.decode())
+
+
+def test_import():
+    result = run()
+    assert result['modules'] == []
+    assert result['time'] < IMPORT_TIME_BUDGET
+
+
+def test_import_create():
+    result = run('''
+from stencila.host import Host
+host = Host()
+context = host.create('PythonContext')
+host.call(context, 'execute', {'code': 'x = 6 * 7'})
+host.create('SqliteContext')
+''')
+    assert result['modules'] == []
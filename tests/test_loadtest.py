@@ -0,0 +1,45 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from stencila.loadtest import loadtest, summarize
+
+
+def test_summarize():
+    results = [('execute', 0.001 * index, index != 3) for index in range(1, 11)]
+    summary = summarize(results, 2)
+    assert summary['requests'] == 10
+    assert summary['errors'] == 1
+    assert summary['error_rate'] == 0.1
+    assert summary['throughput'] == 5
+    assert summary['p50'] == pytest.approx(6)
+    assert summary['p99'] == pytest.approx(10)
+
+
+def test_loadtest():
+    report = loadtest(sessions=2, requests=20, seed=1, quiet=True)
+    assert report['sessions'] == 2
+    assert report['total']['requests'] == 40
+    assert report['total']['errors'] == 0
+    assert report['operations']['create']['requests'] >= 2
+    assert sum(summary['requests'] for summary in report['operations'].values()) == 40
+
+    with pytest.raises(ValueError) as exc:
+        loadtest(mix={'foo': 1})
+    exc.match('Unknown operation: foo')
+
+
+def test_loadtest_main():
+    command = [sys.executable, '-m', 'stencila', 'loadtest', '{"sessions":1,"requests":5}']
+
+    # Prints a table by default...
+    out = subprocess.check_output(command).decode()
+    assert out.splitlines()[0].split()[:3] == ['operation', 'requests', 'errors']
+    assert out.splitlines()[-1].split()[:2] == ['total', '5']
+    assert '{' not in out
+
+    # ...or the report as JSON
+    out = subprocess.check_output(command + ['--json']).decode()
+    assert json.loads(out)['total']['requests'] == 5
@@ -1,4 +1,9 @@
 import os
+import subprocess
+import sys
+import threading
+
+import pytest
 
 from stencila.python_context import PythonContext
 from stencila.value import pack
@@ -199,3 +204,165 @@ def test_imports():
 
     import pandas
     assert cell2['outputs'][0]['value']['data'] == pandas.__version__
+
+
+def test_execute_timeout():
+    context = PythonContext()
+
+    cell = context.execute({'code': 'while True: pass', 'options': {'timeout': 0.1}})
+    assert cell['messages'] == [{
+        'type': 'error',
+        'message': 'Execution timed out after 0.1 seconds',
+        'interrupted': 'timeout'
+    }]
+
+    # Code can not catch the interruption
+    context = PythonContext(timeout=0.1)
+    cell = context.execute('try:\n  while True: pass\nexcept Exception:\n  pass')
+    assert cell['messages'][0]['interrupted'] == 'timeout'
+
+    # Context is still usable
+    cell = context.execute('x = 42')
+    assert cell['messages'] == []
+    assert cell['outputs'][0]['value']['data'] == 42
+
+
+def test_cancel():
+    context = PythonContext()
+    assert not context.cancel()
+
+    timer = threading.Timer(0.1, context.cancel)
+    timer.start()
+    cell = context.execute('while True: pass')
+    assert cell['messages'][0]['message'] == 'Execution was cancelled'
+    assert cell['messages'][0]['interrupted'] == 'cancelled'
+
+    assert context.execute('6 * 7')['outputs'][0]['value']['data'] == 42
+
+
+def test_execute_emit():
+    context = PythonContext()
+    events = []
+
+    cell = context.execute({
+        'code': 'import sys\nprint("one")\nsys.stderr.write("two")\nimport matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.show()\n42'
+    }, emit=lambda event, data: events.append((event, data)))
+    assert cell['outputs'][0]['value']['data'] == 42
+
+    names = [event for event, data in events]
+    assert names[0] == 'start'
+    assert ('stdout', {'text': 'one'}) in events
+    assert ('stderr', {'text': 'two'}) in events
+    assert 'figure' in names
+    figure = events[names.index('figure')][1]
+    assert figure['type'] == 'image'
+    assert figure['src'].startswith('data:image/png;base64,')
+    assert names[-1] == 'end'
+    assert events[-1][1]['duration'] > 0
+
+    # Output is not captured when not emitting
+    events[:] = []
+    context.execute('print("three")')
+    assert events == []
+
+
+def test_execute_format():
+    context = PythonContext()
+
+    code = 'import pandas\npandas.DataFrame({"a": [1.5, 2.5]})'
+    assert context.execute(code)['outputs'][0]['value']['format'] == 'json'
+
+    value = context.execute({'code': code, 'options': {'format': 'columnar'}})['outputs'][0]['value']
+    assert value['format'] == 'columnar'
+    assert value['data']['columns'][0]['dtype'] == '<f8'
+
+
+def test_execute_pointer():
+    context = PythonContext(name='pythonContext1', max_rows=10)
+
+    # Small tables are output as packages
+    cell = context.execute('import numpy, pandas\nsmall = pandas.DataFrame({"a": numpy.arange(10)})')
+    assert cell['outputs'][0]['value']['format'] == 'json'
+
+    # Large tables are output as pointers
+    cell = context.execute('import numpy, pandas\nbig = pandas.DataFrame({"a": numpy.arange(100), "b": numpy.arange(100) % 3})')
+    big = cell['outputs'][0]['value']
+    assert big == {
+        'type': 'table',
+        'host': None,
+        'context': 'pythonContext1',
+        'name': 'big',
+        'rows': 100,
+        'columns': ['a', 'b']
+    }
+
+    # Tables not assigned to a variable are held
+    pointer = context.execute({
+        'code': 'big.tail(50)',
+        'inputs': [{'name': 'big', 'value': big}]
+    })['outputs'][0]['value']
+    assert pointer['name'] == 'output1'
+    assert context.fetch('output1', {'limit': 1})['data']['data'] == {'a': [50], 'b': [2]}
+
+    # Pointers can be used as inputs
+    cell = context.execute({
+        'code': 'len(x)',
+        'inputs': [{'name': 'x', 'value': pointer}]
+    })
+    assert cell['outputs'][0]['value']['data'] == 50
+
+    # The maximum number of rows can be set for a cell
+    cell = context.execute({
+        'code': 'big',
+        'inputs': [{'name': 'big', 'value': big}],
+        'options': {'max_rows': 100}
+    })
+    assert len(cell['outputs'][0]['value']['data']['data']['a']) == 100
+
+
+def test_fetch():
+    context = PythonContext(max_rows=10)
+    context.execute('import numpy, pandas\nbig = pandas.DataFrame({"a": numpy.arange(100), "b": numpy.arange(100) % 3})')
+
+    page = context.fetch('big')
+    assert page['rows'] == 100
+    assert page['offset'] == 0
+    assert page['data']['data']['a'] == list(range(10))
+
+    page = context.fetch('big', {'offset': 95, 'limit': 10, 'columns': ['b']})
+    assert page['data']['data'] == {'b': [2, 0, 1, 2, 0]}
+
+    page = context.fetch('big', {'filter': [['b', '==', 1], ['a', '>', 50]], 'sort': '-a', 'limit': 3})
+    assert page['rows'] == 16
+    assert page['data']['data']['a'] == [97, 94, 91]
+
+    page = context.fetch({'name': 'big', 'filter': [['a', 'in', [1, 2]]], 'format': 'columnar'})
+    assert page['format'] == 'columnar'
+    assert page['rows'] == 2
+
+    context.execute('x = 42')
+    assert context.fetch('x')['data'] == 42
+
+    with pytest.raises(RuntimeError) as exc:
+        context.fetch('foo')
+    exc.match('Unknown variable: foo')
+
+    with pytest.raises(RuntimeError) as exc:
+        context.fetch('big', {'sort': 'c'})
+    exc.match('Unknown column: c')
+
+
+def test_matplotlib_backend():
+    # In a new interpreter so that `matplotlib` has not already been imported
+    code = '''
+import os
+import subprocess
+import sys
+from stencila.python_context import PythonContext
+PythonContext()
+import matplotlib
+print(matplotlib.get_backend())
+print('MPLBACKEND' in os.environ)
+'''
+    output = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+    assert output == ['module://stencila.matplotlib_backend', 'False']
@@ -4,9 +4,12 @@ import os
 import math
 
 import pytest
+import numpy
 import pandas
 import matplotlib.pyplot as plt
 
+from stencila import binary
+from stencila.host_http_server import to_json
 from stencila.value import type, pack, pack_function, unpack
 
 
@@ -103,6 +106,26 @@ def test_pack_works_for_a_data_frame():
     )
 
 
+def test_pack_data_frame_nulls():
+    frame = pandas.DataFrame({
+        'a': [1.5, numpy.nan, 3.5],
+        'b': ['x', None, numpy.nan],
+        'c': pandas.array([1, None, 3], dtype='Int64'),
+        'd': numpy.array([1, 2, 3], dtype='uint8')
+    })
+    data = pack(frame)['data']['data']
+    assert data == {
+        'a': [1.5, None, 3.5],
+        'b': ['x', None, None],
+        'c': [1, None, 3],
+        'd': [1, 2, 3]
+    }
+    assert all(isinstance(value, int) for value in data['d'])
+
+    # The data frame is not modified
+    assert numpy.isnan(frame['a'][1])
+
+
 def test_pack_works_for_plots():
     check(
         pandas.DataFrame(),
@@ -306,3 +329,36 @@ def test_unpack_works_for_tabular_data():
 
     with pytest.raises(Exception):
         unpack({'type': 'table', 'format': 'foo', 'data': 'bar'})
+
+
+def test_pack_unpack_columnar():
+    frame = pandas.DataFrame(OrderedDict((
+        ('a', numpy.arange(5)),
+        ('b', numpy.array([1.5, numpy.nan, 2, 3, 4], dtype='float32')),
+        ('c', [True, False, True, True, False]),
+        ('d', ['a', None, u'ü', 'dd', '']),
+        ('e', pandas.array([1, None, 3, 4, 5], dtype='Int64')),
+        ('f', pandas.to_datetime(['2020-01-01', None, '2020-01-03', '2020-01-04', '2020-01-05'])),
+        ('g', [1, 'x', None, 2.5, 'y'])
+    )))
+
+    pkg = pack(frame, 'columnar')
+    assert pkg['type'] == 'table'
+    assert pkg['format'] == 'columnar'
+    assert pkg['data']['rows'] == 5
+    columns = dict((column['name'], column) for column in pkg['data']['columns'])
+    assert columns['a']['dtype'] == '<i8'
+    assert columns['a']['data'] == numpy.arange(5, dtype='<i8').tobytes()
+    assert 'valid' not in columns['a']
+    assert columns['b']['dtype'] == '<f4'
+    assert columns['b']['valid'] == bytes(bytearray([0b10111000]))
+    assert columns['d']['dtype'] == 'string'
+    assert columns['d']['data'] == u'aüdd'.encode('utf-8')
+    assert numpy.frombuffer(columns['d']['offsets'], dtype='<i8').tolist() == [0, 1, 1, 3, 5, 5]
+    assert columns['e']['extension'] == 'Int64'
+    assert columns['g']['values'] == [1, 'x', None, 2.5, 'y']
+
+    # Round trips using both binary and JSON encodings
+    assert unpack(binary.encode(pkg)).equals(frame)
+    assert unpack(to_json(pkg)).equals(frame)
+    assert unpack(pack(pandas.DataFrame(), 'columnar')).empty
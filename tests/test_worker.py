@@ -0,0 +1,78 @@
+import threading
+import time
+
+from stencila.worker import ThreadWorker, ProcessPool
+
+import pytest
+
+
+def test_thread_worker():
+    worker = ThreadWorker('worker1')
+
+    assert worker.run(lambda: threading.current_thread()) is worker.thread
+    assert worker.run(lambda x, y=0: x * y, 6, y=7) == 42
+
+    def fail():
+        raise RuntimeError('Oops')
+    with pytest.raises(RuntimeError) as exc:
+        worker.run(fail)
+    exc.match('Oops')
+
+    # The thread survives exceptions that are not `Exception`s
+    def exit():
+        raise SystemExit(1)
+    with pytest.raises(SystemExit):
+        worker.run(exit)
+    assert worker.run(lambda: 42) == 42
+
+    # Nested runs do not deadlock
+    assert worker.run(lambda: worker.run(lambda: 42)) == 42
+
+    worker.stop()
+    worker.thread.join(1)
+    assert not worker.thread.is_alive()
+
+
+def test_process_pool_warm():
+    pool = ProcessPool(size=2, warm=1)
+
+    # Wait for the warm worker to be started
+    for attempt in range(300):
+        if pool.warm:
+            break
+        time.sleep(0.1)
+    assert pool.warm == 1
+
+    # A warm worker is used for the warm type...
+    worker = pool.acquire('PythonContext', {'name': 'pythonContext1'})
+    assert worker.call('execute', {'code': '6 * 7'})['outputs'][0]['value']['data'] == 42
+    assert worker.call('execute', {'code': 'import sys\n"numpy" in sys.modules'})['outputs'][0]['value']['data']
+
+    # ...and replaced
+    for attempt in range(300):
+        if pool.warm:
+            break
+        time.sleep(0.1)
+    assert pool.warm == 1
+
+    # A warm worker is stopped to make way for other types when the pool is full
+    other = pool.acquire('SqliteContext', {})
+    assert pool.warm == 0
+
+    # Once the pool is full, no more workers are started
+    assert pool.acquire('SqliteContext', {}) is None
+
+    pool.release(worker)
+    pool.release(other)
+    pool.stop()
+
+
+def test_process_pool_warming():
+    pool = ProcessPool(size=1, warm=1)
+
+    # Workers that are warming up do not stop others from being created
+    worker = pool.acquire('SqliteContext', {})
+    assert worker is not None
+
+    pool.release(worker)
+    pool.stop()